@@ -79,4 +79,12 @@ notes:
       a [default] section and the following keys: subscription_id, client_id, secret and tenant or
       subscription_id, ad_user and password. It is also possible to add additional profiles. Specify the profile
       by passing profile or setting AZURE_PROFILE in the environment."
+    - Access tokens and resource provider registrations are cached in ~/.azure/ansible, so that each module run
+      does not need to authenticate or register providers again. Tokens are reused until shortly before they
+      expire. Set AZURE_CACHE_DIR in the environment to use a different directory.
+    - When the cryptography package is installed, storage account keys are also cached in ~/.azure/ansible for
+      15 minutes, encrypted with a key derived from the secret or password, so that repeated blob operations do
+      not list the account keys again. Without it, keys are only reused within a module run.
+    - Long running operations are polled at intervals starting at 2 seconds and backing off to 20 seconds, or as
+      directed by the service. The time taken and number of polls for each operation are returned in poller_stats.
     '''
\ No newline at end of file
@@ -18,13 +18,21 @@
 # along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import base64
 import ConfigParser
+import fcntl
+import hashlib
 import json
 import os
 import re
 import sys
 import copy
+import tempfile
+import threading
+import time
+import Queue
 
+from contextlib import contextmanager
 from os.path import expanduser
 from ansible.module_utils.basic import *
 
@@ -68,6 +76,27 @@ AZURE_FAILED_STATE = "Failed"
 
 AZURE_MIN_VERSION = "2016-03-30"
 
+# State shared between module runs is kept in this directory
+AZURE_CACHE_DIR = os.environ.get('AZURE_CACHE_DIR', expanduser('~/.azure/ansible'))
+
+# Seconds to trust a cached 'Registered' state before asking Azure to register a resource provider again
+AZURE_PROVIDER_CACHE_TTL = 7 * 24 * 3600
+
+# Seconds before expiry at which a cached access token is no longer used
+AZURE_TOKEN_EXPIRY_MARGIN = 300
+
+# Default number of concurrent requests made by run_parallel
+AZURE_DEFAULT_WORKERS = 10
+
+# Maximum number of blobs returned by a single list request
+AZURE_BLOB_PAGE_SIZE = 5000
+
+# Seconds to keep encrypted storage account keys in the cache directory
+AZURE_STORAGE_KEY_CACHE_TTL = 900
+
+# PBKDF2 iterations used to derive the key encrypting cached storage account keys
+AZURE_STORAGE_KEY_CACHE_ITERATIONS = 100000
+
 HAS_AZURE = True
 HAS_AZURE_EXC = None
 
@@ -84,10 +113,21 @@ try:
     from azure.mgmt.storage.storage_management_client import StorageManagementClient
     from azure.mgmt.compute.compute_management_client import ComputeManagementClient
     from azure.storage.cloudstorageaccount import CloudStorageAccount
+    from azure.common import AzureHttpError
 except ImportError, exc:
     HAS_AZURE_EXC = exc
     HAS_AZURE = False
 
+HAS_CRYPTOGRAPHY = True
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+except ImportError:
+    HAS_CRYPTOGRAPHY = False
+
 
 def azure_id_to_dict(id):
     pieces = re.sub(r'^\/', '', id).split('/')
@@ -99,8 +139,264 @@ def azure_id_to_dict(id):
     return result
 
 
+class AzureRMWorkerError(Exception):
+    '''
+    Raised by AzureRMModuleBase.fail() when it is called from a run_parallel worker thread. Failing the module
+    from a worker would exit the thread rather than the module, so the error is returned to the caller instead.
+    '''
+
+    def __init__(self, msg, **kwargs):
+        super(AzureRMWorkerError, self).__init__(msg)
+        self.kwargs = kwargs
+
+
+_worker_thread = threading.local()
+
+
+def run_parallel(func, items, max_workers=AZURE_DEFAULT_WORKERS):
+    '''
+    Call func for each item using a bounded pool of threads. Items are read lazily, and the next item is only read
+    once fewer than max_workers items are pending, so at most max_workers items read from a generator are held
+    at a time.
+    No more threads than items are started when the number of items is known. An error raised by func, including
+    SystemExit, is collected with its item rather than stopping the remaining calls.
+
+    :param func: function taking a single item
+    :param items: iterable of items
+    :param max_workers: maximum number of concurrent calls
+    :return: list of (result, error) tuples in the order of items
+    '''
+    results = dict()
+    work = Queue.Queue()
+    slots = threading.Semaphore(max_workers)
+    done = object()
+
+    def worker():
+        _worker_thread.active = True
+        while True:
+            entry = work.get()
+            if entry is done:
+                return
+            index, item = entry
+            try:
+                results[index] = (func(item), None)
+            except BaseException, exc:
+                results[index] = (None, exc)
+            slots.release()
+
+    if hasattr(items, '__len__'):
+        max_workers = min(max_workers, len(items))
+    threads = [threading.Thread(target=worker) for i in range(max(1, max_workers))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    count = 0
+    items = iter(items)
+    try:
+        while True:
+            slots.acquire()
+            try:
+                item = next(items)
+            except StopIteration:
+                break
+            work.put((count, item))
+            count += 1
+    finally:
+        for thread in threads:
+            work.put(done)
+        for thread in threads:
+            thread.join()
+
+    return [results[index] for index in range(count)]
+
+
+def list_blob_pages(blob_client, container_name, prefix=None, page_size=AZURE_BLOB_PAGE_SIZE, marker=None,
+                    delimiter=None, include=None):
+    '''
+    Iterate over the blobs of a container one page at a time, so that a large container is never held in memory.
+
+    :param blob_client: BlockBlobService object
+    :param container_name: name of the container
+    :param prefix: only list blobs with names beginning with prefix
+    :param page_size: maximum number of blobs in a page
+    :param marker: continuation marker returned with a previous page
+    :param delimiter: group blobs sharing a name prefix up to the delimiter into a single BlobPrefix item
+    :param include: additional datasets to return, such as 'metadata'
+    :return: generator of (list of blobs, next marker) tuples. The next marker is None on the last page.
+    '''
+    while True:
+        page = blob_client.list_blobs(container_name, prefix=prefix, num_results=page_size, marker=marker,
+                                      delimiter=delimiter, include=include)
+        blobs = list(page)
+        marker = page.next_marker or None
+        yield blobs, marker
+        if not marker:
+            return
+
+
+def read_cache_file(name):
+    '''
+    Read a JSON file from the cache directory.
+
+    :param name: file name within AZURE_CACHE_DIR
+    :return: dict. Empty if the file is missing or unreadable.
+    '''
+    try:
+        with open(os.path.join(AZURE_CACHE_DIR, name), 'r') as cache_file:
+            return json.load(cache_file)
+    except (IOError, OSError, ValueError):
+        return dict()
+
+
+def write_cache_file(name, data):
+    '''
+    Write a JSON file to the cache directory. The data is written to a temporary file, readable only by the
+    owner, and renamed into place so readers never see a partial file. The cache is an optimization, so failing
+    to write it is not an error.
+
+    :param name: file name within AZURE_CACHE_DIR
+    :param data: dict to write
+    :return: None
+    '''
+    try:
+        if not os.path.isdir(AZURE_CACHE_DIR):
+            os.makedirs(AZURE_CACHE_DIR, 0700)
+        fd, temp_path = tempfile.mkstemp(dir=AZURE_CACHE_DIR, prefix='.' + name)
+        with os.fdopen(fd, 'w') as cache_file:
+            json.dump(data, cache_file)
+        os.rename(temp_path, os.path.join(AZURE_CACHE_DIR, name))
+    except (IOError, OSError):
+        pass
+
+
+@contextmanager
+def lock_cache_file(name):
+    '''
+    Hold an exclusive lock on a file in the cache directory, so that concurrent module runs can read, update and
+    write it in turn. If the lock file cannot be created, no lock is taken.
+
+    :param name: file name within AZURE_CACHE_DIR
+    '''
+    lock_file = None
+    try:
+        if not os.path.isdir(AZURE_CACHE_DIR):
+            os.makedirs(AZURE_CACHE_DIR, 0700)
+        lock_file = os.fdopen(os.open(os.path.join(AZURE_CACHE_DIR, name + '.lock'), os.O_CREAT | os.O_RDWR, 0600))
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+    except (IOError, OSError):
+        pass
+    try:
+        yield
+    finally:
+        if lock_file:
+            lock_file.close()
+
+
+class AzureTokenCacheMixin(object):
+    '''
+    Mixin for msrestazure credentials that keeps access tokens in the cache directory, keyed by tenant, client,
+    user, resource, secret and password, all hashed together, so that a changed secret or password requests a
+    new token. A cached token is used until shortly before it expires, so each module run does not need
+    to request a new token from Azure Active Directory.
+    '''
+
+    def set_token(self):
+        key = hashlib.sha256('|'.join([str(getattr(self, 'token_uri', None)),
+                                       str(getattr(self, 'id', None)),
+                                       str(getattr(self, 'username', None)),
+                                       str(getattr(self, 'resource', None)),
+                                       str(getattr(self, 'secret', None)),
+                                       str(getattr(self, 'password', None))])).hexdigest()
+        with lock_cache_file('tokens.json'):
+            tokens = read_cache_file('tokens.json')
+            token = tokens.get(key)
+            if token and self._token_expires_at(token) - AZURE_TOKEN_EXPIRY_MARGIN > time.time():
+                self.token = token
+                return
+
+            super(AzureTokenCacheMixin, self).set_token()
+
+            tokens = dict((k, v) for k, v in tokens.items() if self._token_expires_at(v) > time.time())
+            tokens[key] = self.token
+            write_cache_file('tokens.json', tokens)
+
+    def _token_expires_at(self, token):
+        try:
+            return float(token.get('expires_on') or token.get('expires_at'))
+        except (TypeError, ValueError):
+            return 0
+
+
+class AzureRMBlobClient(object):
+    '''
+    Wrapper around a BlockBlobService that recovers from a regenerated account key. When a call fails with an
+    authentication error, the cached key is dropped, the key is listed again and the call is retried once.
+    '''
+
+    def __init__(self, module, resource_group_name, storage_account_name):
+        self._module = module
+        self._resource_group_name = resource_group_name
+        self._storage_account_name = storage_account_name
+        self._lock = threading.Lock()
+        self._refreshed = False
+        self._client = self._create_client()
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            client = self._client
+            try:
+                return getattr(client, name)(*args, **kwargs)
+            except AzureHttpError, exc:
+                if exc.status_code != 403 or not self._refresh(client):
+                    raise
+            return getattr(self._client, name)(*args, **kwargs)
+        return call
+
+    def _refresh(self, failed_client):
+        # Returns True when the call should be retried with a new client
+        with self._lock:
+            if failed_client is not self._client:
+                return True
+            if self._refreshed:
+                return False
+            self._module.log('Authentication failed, refreshing key of storage account {0}'.format(
+                self._storage_account_name))
+            self._module.forget_cached_storage_account_key(self._resource_group_name, self._storage_account_name)
+            self._client = self._create_client()
+            self._refreshed = True
+            return True
+
+    def _create_client(self):
+        account_key = self._module.get_storage_account_key(self._resource_group_name, self._storage_account_name)
+        try:
+            self._module.log('Create blob service')
+            return CloudStorageAccount(self._storage_account_name, account_key).create_block_blob_service()
+        except Exception, exc:
+            self._module.fail("Error creating blob service client for storage account {0} - {1}".format(
+                self._storage_account_name, str(exc)))
+
+
+if HAS_AZURE:
+    class AzureRMServicePrincipalCredentials(AzureTokenCacheMixin, ServicePrincipalCredentials):
+        pass
+
+    class AzureRMUserPassCredentials(AzureTokenCacheMixin, UserPassCredentials):
+        pass
+
+
 class AzureRMModuleBase(object):
 
+    # Schedule for polling long running operations. Polling starts at poller_initial_delay seconds and backs off
+    # by a factor of poller_backoff up to poller_max_delay seconds. Override in a derived class to change it.
+    poller_initial_delay = 2
+    poller_backoff = 2
+    poller_max_delay = 20
+
     def __init__(self, derived_arg_spec, bypass_checks=False, no_log=False,
                  check_invalid_arguments=True, mutually_exclusive=None, required_together=None,
                  required_one_of=None, add_file_common_args=False, supports_check_mode=False,
@@ -140,6 +436,9 @@ class AzureRMModuleBase(object):
         self._storage_client = None
         self._resource_client = None
         self._compute_client = None
+        self._blob_clients = dict()
+        self._blob_client_lock = threading.Lock()
+        self._poller_stats = []
         self.check_mode = self.module.check_mode
         self.facts_module = facts_module
         self.debug = self.module.params.get('debug')
@@ -158,11 +457,12 @@ class AzureRMModuleBase(object):
         if self.credentials.get('client_id') is not None and \
            self.credentials.get('secret') is not None and \
            self.credentials.get('tenant') is not None:
-            self.azure_credentials = ServicePrincipalCredentials(client_id=self.credentials['client_id'],
-                                                                 secret=self.credentials['secret'],
-                                                                 tenant=self.credentials['tenant'])
+            self.azure_credentials = AzureRMServicePrincipalCredentials(client_id=self.credentials['client_id'],
+                                                                        secret=self.credentials['secret'],
+                                                                        tenant=self.credentials['tenant'])
         elif self.credentials.get('ad_user') is not None and self.credentials.get('password') is not None:
-            self.azure_credentials = UserPassCredentials(self.credentials['ad_user'], self.credentials['password'])
+            self.azure_credentials = AzureRMUserPassCredentials(self.credentials['ad_user'],
+                                                                self.credentials['password'])
         else:
             self.fail("Failed to authenticate with provided credentials. Some attributes were missing. "
                       "Credentials must include client_id, secret and tenant or ad_user and password.")
@@ -172,6 +472,8 @@ class AzureRMModuleBase(object):
             self.validate_tags(self.module.params['tags'])
 
         res = self.exec_module(**self.module.params)
+        if self._poller_stats:
+            res['poller_stats'] = self._poller_stats
         self.module.exit_json(**res)
 
     def exec_module(self, **kwargs):
@@ -185,6 +487,8 @@ class AzureRMModuleBase(object):
         :param kwargs: Any key=value pairs
         :return: None
         '''
+        if getattr(_worker_thread, 'active', False):
+            raise AzureRMWorkerError(msg, **kwargs)
         self.module.fail_json(msg=msg, **kwargs)
 
     def log(self, msg, pretty_print=False):
@@ -401,22 +705,43 @@ class AzureRMModuleBase(object):
         serializer = Serializer()
         return serializer.body(obj, class_name)
 
-    def get_poller_result(self, poller, wait=20):
+    def get_poller_result(self, poller, wait=None, operation=None):
         '''
-        Consistent method of waiting on and retrieving results from Azure's long poller
+        Consistent method of waiting on and retrieving results from Azure's long poller. The poller checks the
+        operation status on a background thread, sleeping for the interval set in the client configuration, or
+        for the Retry-After interval when the service sends one. The interval starts at poller_initial_delay
+        and is backed off after each poll. Wall time and poll count are added to the module results as
+        poller_stats.
 
         :param poller Azure poller object
+        :param wait maximum seconds between polls. Defaults to poller_max_delay.
+        :param operation description of the operation reported in poller_stats. Defaults to the request URL.
         :return object resulting from the original request
         '''
+        if not operation:
+            request = getattr(getattr(poller, '_response', None), 'request', None)
+            operation = getattr(request, 'url', '').split('?')[0] or None
+        max_delay = wait or self.poller_max_delay
+        delay = min(self.poller_initial_delay, max_delay)
+        polls = 0
+        start = time.time()
         try:
-            delay = wait
             while not poller.done():
+                if hasattr(poller, '_timeout'):
+                    # interval used by the poller thread when the service does not send Retry-After
+                    poller._timeout = delay
                 self.log("Waiting for {0} sec".format(delay))
                 poller.wait(timeout=delay)
+                polls += 1
+                delay = min(delay * self.poller_backoff, max_delay)
             return poller.result()
         except Exception, exc:
             self.log(str(exc))
             raise
+        finally:
+            self._poller_stats.append(dict(operation=operation,
+                                           elapsed=round(time.time() - start, 3),
+                                           polls=polls))
 
     def check_provisioning_state(self, azure_object, requested_state='present'):
         '''
@@ -454,6 +779,109 @@ class AzureRMModuleBase(object):
                     azure_object.name, azure_object.provisioning_state, AZURE_SUCCESS_STATE))
 
     def get_blob_client(self, resource_group_name, storage_account_name):
+        '''
+        Get a blob service client for a storage account. The client is reused for the rest of the module run, and
+        lists the account key again once if a call fails because the key was regenerated.
+
+        :param resource_group_name: name of the resource group containing the storage account
+        :param storage_account_name: name of the storage account
+        :return: AzureRMBlobClient object, used like a BlockBlobService object
+        '''
+        client_key = (resource_group_name.lower(), storage_account_name.lower())
+        with self._blob_client_lock:
+            if client_key not in self._blob_clients:
+                self._blob_clients[client_key] = AzureRMBlobClient(self, resource_group_name, storage_account_name)
+            return self._blob_clients[client_key]
+
+    def get_storage_account_key(self, resource_group_name, storage_account_name):
+        '''
+        Get the primary key of a storage account. When the cryptography package is installed, the key is cached in
+        the cache directory for AZURE_STORAGE_KEY_CACHE_TTL seconds, encrypted with a key derived from the secret
+        or password used to authenticate. Otherwise the key is listed on every module run.
+
+        :param resource_group_name: name of the resource group containing the storage account
+        :param storage_account_name: name of the storage account
+        :return: account key
+        '''
+        secret = self.credentials.get('secret') or self.credentials.get('password')
+        if not HAS_CRYPTOGRAPHY or not secret:
+            return self._list_storage_account_key(resource_group_name, storage_account_name)
+
+        cache_key = self._storage_account_cache_key(resource_group_name, storage_account_name)
+        with lock_cache_file('storage_keys.json'):
+            cache = read_cache_file('storage_keys.json')
+            salt = cache.get('salt') or base64.b64encode(os.urandom(16))
+            kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=base64.b64decode(salt),
+                             iterations=AZURE_STORAGE_KEY_CACHE_ITERATIONS, backend=default_backend())
+            fernet = Fernet(base64.urlsafe_b64encode(kdf.derive(str(secret))))
+
+            now = time.time()
+            keys = dict((k, v) for k, v in cache.get('keys', dict()).items() if v.get('expires_on', 0) > now)
+            if keys.get(cache_key):
+                try:
+                    return fernet.decrypt(str(keys[cache_key]['key']))
+                except InvalidToken:
+                    # cached with other credentials
+                    pass
+
+            account_key = self._list_storage_account_key(resource_group_name, storage_account_name)
+            keys[cache_key] = dict(key=fernet.encrypt(str(account_key)),
+                                   expires_on=now + AZURE_STORAGE_KEY_CACHE_TTL)
+            write_cache_file('storage_keys.json', dict(salt=salt, keys=keys))
+            return account_key
+
+    def forget_storage_account_key(self, resource_group_name, storage_account_name):
+        '''
+        Remove the blob client and cached key of a storage account, for example after deleting the account.
+
+        :param resource_group_name: name of the resource group containing the storage account
+        :param storage_account_name: name of the storage account
+        :return: None
+        '''
+        with self._blob_client_lock:
+            self._blob_clients.pop((resource_group_name.lower(), storage_account_name.lower()), None)
+        self.forget_cached_storage_account_key(resource_group_name, storage_account_name)
+
+    def forget_cached_storage_account_key(self, resource_group_name, storage_account_name):
+        '''
+        Remove the cached key of a storage account from the cache directory.
+
+        :param resource_group_name: name of the resource group containing the storage account
+        :param storage_account_name: name of the storage account
+        :return: None
+        '''
+        with lock_cache_file('storage_keys.json'):
+            cache = read_cache_file('storage_keys.json')
+            if cache.get('keys', dict()).pop(self._storage_account_cache_key(resource_group_name,
+                                                                             storage_account_name), None):
+                write_cache_file('storage_keys.json', cache)
+
+    def _storage_account_cache_key(self, resource_group_name, storage_account_name):
+        return hashlib.sha256('|'.join([self.subscription_id.lower(),
+                                        resource_group_name.lower(),
+                                        storage_account_name.lower()])).hexdigest()
+
+    def blob_container_has_blobs(self, blob_client, container_name, prefix=None):
+        '''
+        Check if a blob container holds any blob, listing at most one blob and no metadata.
+
+        :param blob_client: BlockBlobService object
+        :param container_name: name of the container
+        :param prefix: only consider blobs with names beginning with prefix
+        :return: boolean
+        '''
+        return len(blob_client.list_blobs(container_name, prefix=prefix, num_results=1).items) > 0
+
+    def storage_account_has_containers(self, blob_client):
+        '''
+        Check if a storage account holds any blob container, listing at most one container and no metadata.
+
+        :param blob_client: BlockBlobService object
+        :return: boolean
+        '''
+        return len(blob_client.list_containers(num_results=1).items) > 0
+
+    def _list_storage_account_key(self, resource_group_name, storage_account_name):
         try:
             # Get keys from the storage account
             self.log('Getting keys')
@@ -461,13 +889,7 @@ class AzureRMModuleBase(object):
             keys = {v.key_name: v.value for v in account_keys.keys}
         except Exception, exc:
             self.fail("Error getting keys for account {0} - {1}".format(storage_account_name, str(exc)))
-
-        try:
-            self.log('Create blob service')
-            return CloudStorageAccount(storage_account_name, keys['key1']).create_block_blob_service()
-        except Exception, exc:
-            self.fail("Error creating blob service client for storage account {0} - {1}".format(storage_account_name,
-                                                                                                str(exc)))
+        return keys['key1']
 
     def create_default_pip(self, resource_group, location, name, allocation_method='Dynamic'):
         '''
@@ -578,20 +1000,44 @@ class AzureRMModuleBase(object):
         return self.get_poller_result(poller)
 
     def _register(self, key):
+        if self._provider_is_registered(key):
+            self.log("Provider {0} is registered".format(key))
+            return
+
         try:
             # We have to perform the one-time registration here. Otherwise, we receive an error the first
             # time we attempt to use the requested client.
             resource_client = self.rm_client
-            resource_client.providers.register(key)
+            provider = resource_client.providers.register(key)
         except Exception, exc:
             self.fail("One-time registration of {0} failed - {1}".format(key, str(exc)))
 
+        if provider and provider.registration_state == 'Registered':
+            self._cache_provider_registration(key)
+
+    def _provider_is_registered(self, key):
+        '''
+        Check the provider cache for a recent 'Registered' state for the subscription.
+
+        :param key: resource provider namespace. For example, 'Microsoft.Compute'
+        :return: bool
+        '''
+        registered_at = read_cache_file('providers.json').get(self.subscription_id, dict()).get(key)
+        return registered_at is not None and registered_at + AZURE_PROVIDER_CACHE_TTL > time.time()
+
+    def _cache_provider_registration(self, key):
+        with lock_cache_file('providers.json'):
+            providers = read_cache_file('providers.json')
+            providers.setdefault(self.subscription_id, dict())[key] = time.time()
+            write_cache_file('providers.json', providers)
+
     @property
     def storage_client(self):
         self.log('Getting storage client...')
         if not self._storage_client:
             self._storage_client = StorageManagementClient(self.azure_credentials, self.subscription_id)
             self._storage_client.config.add_user_agent(ANSIBLE_USER_AGENT)
+            self._storage_client.config.long_running_operation_timeout = self.poller_initial_delay
             self._register('Microsoft.Storage')
         return self._storage_client
 
@@ -601,6 +1047,7 @@ class AzureRMModuleBase(object):
         if not self._network_client:
             self._network_client = NetworkManagementClient(self.azure_credentials, self.subscription_id)
             self._network_client.config.add_user_agent(ANSIBLE_USER_AGENT)
+            self._network_client.config.long_running_operation_timeout = self.poller_initial_delay
             self._register('Microsoft.Network')
         return self._network_client
 
@@ -610,6 +1057,7 @@ class AzureRMModuleBase(object):
         if not self._resource_client:
             self._resource_client = ResourceManagementClient(self.azure_credentials, self.subscription_id)
             self._resource_client.config.add_user_agent(ANSIBLE_USER_AGENT)
+            self._resource_client.config.long_running_operation_timeout = self.poller_initial_delay
         return self._resource_client
 
     @property
@@ -618,5 +1066,6 @@ class AzureRMModuleBase(object):
         if not self._compute_client:
             self._compute_client = ComputeManagementClient(self.azure_credentials, self.subscription_id)
             self._compute_client.config.add_user_agent(ANSIBLE_USER_AGENT)
+            self._compute_client.config.long_running_operation_timeout = self.poller_initial_delay
             self._register('Microsoft.Compute')
         return self._compute_client
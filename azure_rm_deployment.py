@@ -69,6 +69,30 @@ options:
         one of them is required if "state" parameter is "present".
     required: false
     default: None
+  skip_unchanged:
+    description:
+      - Do not submit the deployment when the template, parameters, mode, location and tags are unchanged since
+        the last successful deployment. An HMAC-SHA256 of these settings, including the content of template_link
+        and parameters_link, is stored in the resource group tag 'ansible-deployment-<deployment_name>' after each
+        successful deployment, keeping the other tags of the group. The HMAC key is generated on the first use
+        and kept in the cache directory of the host running the module, so that parameters such as secureStrings
+        cannot be recovered from the tag. A deployment run from another host, or after the cache directory is
+        removed, is submitted once again. Leave false to deploy on every run, for example to correct changes made
+        to the resources outside of the template.
+    required: false
+    default: false
+  wait_for_deployment_completion:
+    description:
+      - Wait for the deployment to complete. While waiting, the deployment operations are listed to follow their
+        progress, and the module fails as soon as an operation fails, rather than when the deployment completes.
+    required: false
+    default: true
+  wait_for_deployment_polling_period:
+    description:
+      - Maximum seconds between checks of the deployment operations. Checks start 2 seconds apart, and back off
+        to this period while no operation changes state.
+    required: false
+    default: 30
 
 extends_documentation_fragment:
     - azure
@@ -315,7 +339,7 @@ EXAMPLES = '''
 
 RETURN = '''
 msg:
-  description: String indicating if the deployment was created or deleted
+  description: String indicating if the deployment was created, unchanged or deleted
   returned: always
   type: string
   sample: "deployment created"
@@ -357,10 +381,17 @@ deployment:
     }
 '''
 
+import base64
+import collections
+import hashlib
+import hmac
+import json
+import os
 import time
 import yaml
 
 from ansible.module_utils.basic import *
+from ansible.module_utils.urls import open_url
 from ansible.module_utils.azure_rm_common import *
 
 try:
@@ -371,8 +402,7 @@ try:
                                                       ParametersLink,
                                                       TemplateLink,
                                                       Deployment,
-                                                      ResourceGroup,
-                                                      Dependency)
+                                                      ResourceGroup)
     from azure.mgmt.resource.resources import ResourceManagementClient
     from azure.mgmt.network import NetworkManagementClient
 
@@ -381,6 +411,76 @@ except ImportError:
     pass
 
 
+DEPLOYMENT_TERMINAL_STATES = ['Canceled', 'Failed', 'Deleted', 'Succeeded']
+
+# Limits on the nested deployments searched for failed operations
+FAILED_OPERATIONS_MAX_DEPTH = 5
+FAILED_OPERATIONS_MAX_COUNT = 100
+
+# Resource group tag recording the hash of the last successful deployment, followed by its name
+DEPLOYMENT_HASH_TAG_PREFIX = 'ansible-deployment-'
+
+# Cache file holding the key of the deployment hash
+DEPLOYMENT_HASH_KEY_FILE = 'deployment_hash_key.json'
+
+
+class DependencyGraph(object):
+    '''
+    Graph of the resources of a deployment, built in one pass over deployment.properties.dependencies. Resources
+    are keyed by id, with an adjacency map from each resource to the resources it depends on, and an index of
+    resources by type. A resource shared by several others is a single node, and cycles are tolerated.
+    '''
+
+    def __init__(self, dependencies):
+        self.resources = dict()
+        self.depends_on = dict()
+        self.by_type = dict()
+        for dep in dependencies or []:
+            self._add(dep)
+            for parent in getattr(dep, 'depends_on', None) or []:
+                self._add(parent)
+                self.depends_on[self._key(dep)].append(self._key(parent))
+
+    def _key(self, dep):
+        return (dep.id or dep.resource_name).lower()
+
+    def _add(self, dep):
+        key = self._key(dep)
+        if key not in self.resources:
+            self.resources[key] = dep
+            self.depends_on[key] = []
+            self.by_type.setdefault(dep.resource_type, []).append(key)
+
+    def of_type(self, resource_type):
+        '''
+        :param resource_type: resource type, for example 'Microsoft.Compute/virtualMachines'
+        :return: list of resources of the type
+        '''
+        return [self.resources[key] for key in self.by_type.get(resource_type, [])]
+
+    def dependencies(self, dep, resource_type=None):
+        '''
+        Find the resources a resource depends on, directly or through other resources, breadth first.
+
+        :param dep: resource
+        :param resource_type: only return resources of this type
+        :return: list of resources
+        '''
+        start = self._key(dep)
+        visited = set([start])
+        queue = collections.deque([start])
+        matches = []
+        while queue:
+            for key in self.depends_on.get(queue.popleft(), []):
+                if key in visited:
+                    continue
+                visited.add(key)
+                queue.append(key)
+                if resource_type is None or self.resources[key].resource_type == resource_type:
+                    matches.append(self.resources[key])
+        return matches
+
+
 class AzureRMDeploymentManager(AzureRMModuleBase):
 
     def __init__(self):
@@ -395,6 +495,7 @@ class AzureRMDeploymentManager(AzureRMModuleBase):
             location=dict(type='str', default="westus"),
             deployment_mode=dict(type='str', default='complete', choices=['complete', 'incremental']),
             deployment_name=dict(type='str', default="ansible-arm"),
+            skip_unchanged=dict(type='bool', default=False),
             wait_for_deployment_completion=dict(type='bool', default=True),
             wait_for_deployment_polling_period=dict(type='int', default=30)
         )
@@ -411,6 +512,7 @@ class AzureRMDeploymentManager(AzureRMModuleBase):
         self.location = None
         self.deployment_mode = None
         self.deployment_name = None
+        self.skip_unchanged = None
         self.wait_for_deployment_completion = None
         self.wait_for_deployment_polling_period = None
         self.tags = None
@@ -431,7 +533,16 @@ class AzureRMDeploymentManager(AzureRMModuleBase):
             setattr(self, key, kwargs[key])
 
         if self.state == 'present':
-            deployment = self.deploy_template()
+            deployment_hash = self._get_deployment_hash() if self.skip_unchanged else None
+            deployment = self._get_unchanged_deployment(deployment_hash) if deployment_hash else None
+            if deployment:
+                self.results['msg'] = 'deployment unchanged'
+            else:
+                deployment = self.deploy_template()
+                if deployment_hash:
+                    self._record_deployment_hash(deployment_hash, deployment)
+                self.results['changed'] = True
+                self.results['msg'] = 'deployment created'
             self.results['deployment'] = dict(
                 name=deployment.name,
                 group_name=self.resource_group_name,
@@ -439,8 +550,6 @@ class AzureRMDeploymentManager(AzureRMModuleBase):
                 outputs=deployment.properties.outputs,
                 instances=self._get_instances(deployment)
             )
-            self.results['changed'] = True
-            self.results['msg'] = 'deployment created'
         else:
             if self.resource_group_exists(self.resource_group_name):
                 self.destroy_resource_group()
@@ -473,24 +582,29 @@ class AzureRMDeploymentManager(AzureRMModuleBase):
                 uri=self.template_link
             )
 
-        params = ResourceGroup(location=self.location, tags=self.tags)
-
-        try:
-            self.rm_client.resource_groups.create_or_update(self.resource_group_name, params)
-        except CloudError as exc:
-            self.fail("Resource group create_or_update failed with status code: %s and message: %s" %
-                      (exc.status_code, exc.message))
+        # merge into the tags of an existing group, which may hold tags set outside of this task
+        resource_group = self._get_resource_group()
+        if resource_group:
+            update_tags, tags = self.update_tags(resource_group.tags)
+            params = ResourceGroup(location=resource_group.location, tags=tags) if update_tags else None
+        else:
+            params = ResourceGroup(location=self.location, tags=self.tags)
+
+        if params:
+            try:
+                self.rm_client.resource_groups.create_or_update(self.resource_group_name, params)
+            except CloudError as exc:
+                self.fail("Resource group create_or_update failed with status code: %s and message: %s" %
+                          (exc.status_code, exc.message))
         try:
             result = self.rm_client.deployments.create_or_update(self.resource_group_name,
                                                                  self.deployment_name,
                                                                  deploy_parameter)
 
-            deployment_result = self.get_poller_result(result)
             if self.wait_for_deployment_completion:
-                while deployment_result.properties.provisioning_state not in ['Canceled', 'Failed', 'Deleted',
-                                                                              'Succeeded']:
-                    time.sleep(self.wait_for_deployment_polling_period)
-                    deployment_result = self.rm_client.deployments.get(self.resource_group_name, self.deployment_name)
+                deployment_result = self._wait_for_deployment(result)
+            else:
+                deployment_result = self.get_poller_result(result)
         except CloudError as exc:
             failed_deployment_operations = self._get_failed_deployment_operations(self.deployment_name)
             self.log("Deployment failed %s: %s" % (exc.status_code, exc.message))
@@ -505,6 +619,152 @@ class AzureRMDeploymentManager(AzureRMModuleBase):
 
         return deployment_result
 
+    def _get_deployment_hash(self):
+        '''
+        Hash the template, parameters, mode, location and tags of the deployment, serialized with sorted keys, with
+        HMAC-SHA256 keyed by _get_deployment_hash_key. Linked templates and parameters are fetched, so that changes
+        to their content are detected.
+
+        :return: hex digest, or None if a linked file could not be read
+        '''
+        try:
+            template = self._get_linked_json(self.template_link) if self.template_link else self.template
+            parameters = self._get_linked_json(self.parameters_link) if self.parameters_link else self.parameters
+        except Exception as exc:
+            self.log("Failed to read linked template or parameters: {0}".format(str(exc)))
+            return None
+        content = json.dumps(dict(template=template,
+                                  parameters=parameters,
+                                  mode=self.deployment_mode,
+                                  location=self.location,
+                                  tags=self.tags), sort_keys=True, separators=(',', ':'))
+        return hmac.new(self._get_deployment_hash_key(), content, hashlib.sha256).hexdigest()
+
+    def _get_deployment_hash_key(self):
+        '''
+        Get the key of the deployment hash from the cache directory, generating it on the first use.
+
+        :return: key bytes
+        '''
+        with lock_cache_file(DEPLOYMENT_HASH_KEY_FILE):
+            key = read_cache_file(DEPLOYMENT_HASH_KEY_FILE).get('key')
+            if not key:
+                key = base64.b64encode(os.urandom(32))
+                write_cache_file(DEPLOYMENT_HASH_KEY_FILE, dict(key=key))
+        return base64.b64decode(key)
+
+    def _get_linked_json(self, url):
+        return json.loads(open_url(url).read())
+
+    def _get_unchanged_deployment(self, deployment_hash):
+        '''
+        Get the deployment, if its last successful run recorded deployment_hash in the resource group tags.
+
+        :param deployment_hash: hash of the deployment settings
+        :return: deployment, or None if it must be deployed
+        '''
+        try:
+            resource_group = self.rm_client.resource_groups.get(self.resource_group_name)
+            recorded = (resource_group.tags or dict()).get(DEPLOYMENT_HASH_TAG_PREFIX + self.deployment_name)
+            if not recorded or recorded.split(':')[0] != deployment_hash:
+                return None
+            deployment = self.rm_client.deployments.get(self.resource_group_name, self.deployment_name)
+        except CloudError:
+            return None
+        # the correlation id ties the hash to the run that recorded it
+        if deployment.properties.provisioning_state != 'Succeeded' or \
+           recorded != "{0}:{1}".format(deployment_hash, deployment.properties.correlation_id):
+            return None
+        return deployment
+
+    def _record_deployment_hash(self, deployment_hash, deployment):
+        if deployment.properties.provisioning_state != 'Succeeded':
+            return
+        try:
+            resource_group = self.rm_client.resource_groups.get(self.resource_group_name)
+            # keep the other tags of the group, including the hashes of other deployments
+            tags = dict(resource_group.tags or dict())
+            tags[DEPLOYMENT_HASH_TAG_PREFIX + self.deployment_name] = "{0}:{1}".format(
+                deployment_hash, deployment.properties.correlation_id)
+            self.rm_client.resource_groups.create_or_update(self.resource_group_name,
+                                                            ResourceGroup(location=resource_group.location,
+                                                                          tags=tags))
+        except CloudError as exc:
+            # the next run deploys again
+            self.log("Failed to record deployment hash: {0}".format(exc.message))
+
+    def _wait_for_deployment(self, poller):
+        '''
+        Wait for the deployment to reach a terminal state, following the state of its operations. The operations
+        are listed at an interval starting at poller_initial_delay, backing off to wait_for_deployment_polling_period
+        while no operation changes state, and starting over when one does. Fails as soon as an operation fails.
+
+        :param poller: poller returned by deployments.create_or_update
+        :return: deployment
+        '''
+        operation_states = dict()
+        max_delay = max(self.poller_initial_delay, self.wait_for_deployment_polling_period)
+        delay = self.poller_initial_delay
+        polls = 0
+        start = time.time()
+        try:
+            while not poller.done():
+                if hasattr(poller, '_timeout'):
+                    poller._timeout = delay
+                poller.wait(timeout=delay)
+                polls += 1
+                if self._deployment_operations_changed(operation_states):
+                    delay = self.poller_initial_delay
+                else:
+                    delay = min(delay * self.poller_backoff, max_delay)
+
+            deployment = poller.result()
+            while deployment.properties.provisioning_state not in DEPLOYMENT_TERMINAL_STATES:
+                time.sleep(delay)
+                polls += 1
+                if self._deployment_operations_changed(operation_states):
+                    delay = self.poller_initial_delay
+                else:
+                    delay = min(delay * self.poller_backoff, max_delay)
+                deployment = self.rm_client.deployments.get(self.resource_group_name, self.deployment_name)
+            return deployment
+        finally:
+            self._poller_stats.append(dict(operation="deployment {0}".format(self.deployment_name),
+                                           elapsed=round(time.time() - start, 3),
+                                           polls=polls))
+
+    def _deployment_operations_changed(self, operation_states):
+        '''
+        List the deployment operations, and compare their state with operation_states, which is updated. Fails
+        if an operation has failed.
+
+        :param operation_states: dict of operation id: provisioning state seen so far
+        :return: boolean. True if an operation started or changed state.
+        '''
+        changed = False
+        try:
+            operations = list(self.rm_client.deployment_operations.list(self.resource_group_name,
+                                                                        self.deployment_name))
+        except CloudError as exc:
+            # the deployment state is still checked by the poller
+            self.log("List deployment operations failed: {0}".format(str(exc)))
+            return changed
+
+        for operation in operations:
+            state = operation.properties.provisioning_state
+            if operation_states.get(operation.operation_id) == state:
+                continue
+            operation_states[operation.operation_id] = state
+            changed = True
+            target = operation.properties.target_resource
+            self.log("Deployment operation {0} {1}: {2}".format(operation.operation_id,
+                                                                target.id if target else '', state))
+            if state == 'Failed':
+                self.fail("Deployment failed. Operation {0} failed with status code: {1}".format(
+                              operation.operation_id, operation.properties.status_code),
+                          failed_deployment_operations=self._get_failed_deployment_operations(self.deployment_name))
+        return changed
+
     def destroy_resource_group(self):
         """
         Destroy the targeted resource group
@@ -519,6 +779,12 @@ class AzureRMDeploymentManager(AzureRMModuleBase):
                 self.fail("Delete resource group and deploy failed with status code: %s and message: %s" %
                           (e.status_code, e.message))
 
+    def _get_resource_group(self):
+        try:
+            return self.rm_client.resource_groups.get(self.resource_group_name)
+        except CloudError:
+            return None
+
     def resource_group_exists(self, resource_group):
         '''
         Return True/False based on existence of requested resource group.
@@ -533,22 +799,46 @@ class AzureRMDeploymentManager(AzureRMModuleBase):
         return True
 
     def _get_failed_nested_operations(self, current_operations):
-        new_operations = []
-        for operation in current_operations:
-            if operation.properties.provisioning_state == 'Failed':
-                new_operations.append(operation)
-                if operation.properties.target_resource and \
-                   'Microsoft.Resources/deployments' in operation.properties.target_resource.id:
-                    nested_deployment = operation.properties.target_resource.resource_name
-                    try:
-                        nested_operations = self.rm_client.deployment_operations.list(self.resource_group_name,
-                                                                                      nested_deployment)
-                    except CloudError as exc:
-                        self.fail("List nested deployment operations failed with status code: %s and message: %s" %
-                                 (e.status_code, e.message))
-                    new_nested_operations = self._get_failed_nested_operations(nested_operations)
-                    new_operations += new_nested_operations
-        return new_operations
+        '''
+        Collect the failed operations, and the failed operations of the nested deployments they target, one level
+        of nesting at a time. The operations of the nested deployments of a level are listed concurrently. The
+        search stops after FAILED_OPERATIONS_MAX_DEPTH levels or FAILED_OPERATIONS_MAX_COUNT failed operations,
+        returning the operations collected so far.
+
+        :param current_operations: operations of the deployment
+        :return: list of failed operations
+        '''
+        failed_operations = []
+        operations = current_operations
+        for depth in range(FAILED_OPERATIONS_MAX_DEPTH + 1):
+            nested_deployments = []
+            for operation in operations:
+                if operation.properties.provisioning_state != 'Failed':
+                    continue
+                if len(failed_operations) >= FAILED_OPERATIONS_MAX_COUNT:
+                    return failed_operations
+                failed_operations.append(operation)
+                target = operation.properties.target_resource
+                if target and 'Microsoft.Resources/deployments' in target.id:
+                    nested_deployments.append((azure_id_to_dict(target.id).get('resourceGroups',
+                                                                               self.resource_group_name),
+                                               target.resource_name))
+            if not nested_deployments or depth == FAILED_OPERATIONS_MAX_DEPTH:
+                break
+
+            def list_operations(nested_deployment):
+                return list(self.rm_client.deployment_operations.list(*nested_deployment))
+
+            operations = []
+            for nested_deployment, (result, error) in zip(nested_deployments,
+                                                          run_parallel(list_operations, nested_deployments)):
+                if error:
+                    # report the operations found so far rather than losing the deployment error
+                    self.log("List nested deployment {0} operations failed: {1}".format(nested_deployment[1],
+                                                                                        str(error)))
+                    continue
+                operations += result
+        return failed_operations
 
     def _get_failed_deployment_operations(self, deployment_name):
         results = []
@@ -583,39 +873,25 @@ class AzureRMDeploymentManager(AzureRMModuleBase):
         return results
 
     def _get_instances(self, deployment):
-        dep_tree = self._build_hierarchy(deployment.properties.dependencies)
-        vms = self._get_dependencies(dep_tree, resource_type="Microsoft.Compute/virtualMachines")
-        vms_and_nics = [(vm, self._get_dependencies(vm['children'], "Microsoft.Network/networkInterfaces"))
-                        for vm in vms]
-        vms_and_ips = [(vm['dep'], self._nic_to_public_ips_instance(nics))
+        graph = DependencyGraph(deployment.properties.dependencies)
+        vms_and_nics = [(vm, graph.dependencies(vm, "Microsoft.Network/networkInterfaces"))
+                        for vm in graph.of_type("Microsoft.Compute/virtualMachines")]
+        if not vms_and_nics:
+            return []
+        nic_index = self._get_resources_by_id([nic.id for vm, nics in vms_and_nics for nic in nics],
+                                              self.network_client.network_interfaces, 'networkInterfaces')
+        # only the NICs of the deployment's VMs, not every NIC listed in the resource group
+        pip_index = self._get_resources_by_id([ip_configuration.public_ip_address.id
+                                               for vm, nics in vms_and_nics
+                                               for nic in nics
+                                               for ip_configuration in nic_index[nic.id.lower()].ip_configurations
+                                               if ip_configuration.public_ip_address],
+                                              self.network_client.public_ip_addresses, 'publicIPAddresses')
+        vms_and_ips = [(vm, self._nic_to_public_ips_instance(nics, nic_index, pip_index))
                        for vm, nics in vms_and_nics]
         return [dict(vm_name=vm.resource_name, ips=[self._get_ip_dict(ip)
                                                     for ip in ips]) for vm, ips in vms_and_ips if len(ips) > 0]
 
-    def _get_dependencies(self, dep_tree, resource_type):
-        matches = [value for value in dep_tree.values() if value['dep'].resource_type == resource_type]
-        for child_tree in [value['children'] for value in dep_tree.values()]:
-            matches += self._get_dependencies(child_tree, resource_type)
-        return matches
-
-    def _build_hierarchy(self, dependencies, tree=None):
-        tree = dict(top=True) if tree is None else tree
-        for dep in dependencies:
-            if dep.resource_name not in tree:
-                tree[dep.resource_name] = dict(dep=dep, children=dict())
-            if isinstance(dep, Dependency) and dep.depends_on is not None and len(dep.depends_on) > 0:
-                self._build_hierarchy(dep.depends_on, tree[dep.resource_name]['children'])
-
-        if 'top' in tree:
-            tree.pop('top', None)
-            keys = list(tree.keys())
-            for key1 in keys:
-                for key2 in keys:
-                    if key2 in tree and key1 in tree[key2]['children'] and key1 in tree:
-                        tree[key2]['children'][key1] = tree[key1]
-                        tree.pop(key1)
-        return tree
-
     def _get_ip_dict(self, ip):
         ip_dict = dict(name=ip.name,
             id=ip.id,
@@ -629,13 +905,41 @@ class AzureRMDeploymentManager(AzureRMModuleBase):
             }
         return ip_dict
 
-    def _nic_to_public_ips_instance(self, nics):
-        return [self.network_client.public_ip_addresses.get(self.resource_group_name, public_ip_id.split('/')[-1])
-                  for nic_obj in [self.network_client.network_interfaces.get(self.resource_group_name,
-                                                                             nic['dep'].resource_name) for nic in nics]
-                  for public_ip_id in [ip_conf_instance.public_ip_address.id
-                                       for ip_conf_instance in nic_obj.ip_configurations
-                                       if ip_conf_instance.public_ip_address]]
+    def _get_resources_by_id(self, ids, operations, resource_type):
+        '''
+        Get network resources by id. The resources in the deployment's resource group are listed once, and
+        resources in other groups are fetched concurrently.
+
+        :param ids: list of resource ids
+        :param operations: network client operations, such as network_interfaces
+        :param resource_type: id segment naming the resource, such as 'networkInterfaces'
+        :return: dict of lowercase resource id: resource
+        '''
+        try:
+            resources = dict((item.id.lower(), item) for item in operations.list(self.resource_group_name))
+        except CloudError as exc:
+            self.fail("List {0} failed with status code: {1} and message: {2}".format(resource_type,
+                                                                                      exc.status_code, exc.message))
+
+        missing = dict((resource_id.lower(), resource_id) for resource_id in ids
+                       if resource_id.lower() not in resources)
+
+        def get_resource(resource_id):
+            names = azure_id_to_dict(resource_id)
+            return operations.get(names['resourceGroups'], names[resource_type])
+
+        keys = sorted(missing)
+        for key, (item, error) in zip(keys, run_parallel(get_resource, [missing[key] for key in keys])):
+            if error:
+                self.fail("Get {0} failed: {1}".format(missing[key], str(error)))
+            resources[key] = item
+        return resources
+
+    def _nic_to_public_ips_instance(self, nics, nic_index, pip_index):
+        return [pip_index[ip_configuration.public_ip_address.id.lower()]
+                for nic in nics
+                for ip_configuration in nic_index[nic.id.lower()].ip_configurations
+                if ip_configuration.public_ip_address]
 
 
 def main():
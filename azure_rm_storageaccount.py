@@ -161,7 +161,6 @@ from ansible.module_utils.azure_rm_common import *
 
 try:
     from msrestazure.azure_exceptions import CloudError
-    from azure.storage.cloudstorageaccount import CloudStorageAccount
     from azure.common import AzureMissingResourceHttpError, AzureHttpError
     from azure.mgmt.storage.models import AccountType,\
                                           AccountStatus, \
@@ -426,6 +425,7 @@ class AzureRMStorageAccount(AzureRMModuleBase):
                 status = self.storage_client.storage_accounts.delete(self.resource_group, self.name)
                 self.log("delete status: ")
                 self.log(str(status))
+                self.forget_storage_account_key(self.resource_group, self.name)
             except AzureHttpError, e:
                 self.fail("Failed to delete the account: {0}".format(str(e)))
         return True
@@ -436,28 +436,13 @@ class AzureRMStorageAccount(AzureRMModuleBase):
         not be deleted.
         '''
         self.log('Checking for existing blob containers')
+        blob_client = self.get_blob_client(self.resource_group, self.name)
         try:
-            # Get keys from the storage account
-            account_keys = self.storage_client.storage_accounts.list_keys(self.resource_group, self.name)
-            keys = {v.key_name: v.value for v in account_keys.keys}
-        except AzureHttpError as e:
-            self.fail("check_for_container:Failed to get account keys: {0}".format(e))
-
-        try:
-            cloud_storage = CloudStorageAccount(self.name, keys['key1']).create_page_blob_service()
-        except Exception as e:
-            self.fail("check_for_container:Error creating blob service: {0}".format(e))
-
-        try:
-            response = cloud_storage.list_containers()
+            return self.storage_account_has_containers(blob_client)
         except AzureMissingResourceHttpError:
             # No blob storage available?
             return False
 
-        if len(response.items) > 0:
-            return True
-        return False
-
 
 def main():
     AzureRMStorageAccount()
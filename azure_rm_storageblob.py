@@ -38,6 +38,14 @@ options:
         required: true
         aliases:
             - account_name
+    block_size:
+        description:
+            - Size in bytes of the blocks a file is split into when uploading, or of the ranges a blob is split into
+              when downloading. A file larger than block_size is
+              uploaded as a list of blocks, sending up to max_connections blocks at a time. Must not exceed
+              4194304 (4 MB).
+        required: false
+        default: 4194304
     blob:
         description:
             - Name of a blob object within the container.
@@ -51,6 +59,27 @@ options:
         required: true
         aliases:
             - container_name
+    copy_source:
+        description:
+            - List of source blob URLs to copy into the container with a server side copy, so that the data does not
+              pass through the host running the module. Include a shared access signature in the URL of a private
+              blob. With a blob value, a single URL is copied to that blob. Otherwise, each URL is copied to a blob
+              named prefix followed by the source blob name.
+            - The copies are started up to max_connections at a time, and the module waits for them to complete.
+              A blob already copied from the same source is not copied again, unless force is true.
+        required: false
+        default: null
+    content:
+        description:
+            - String to upload as the blob content. Use instead of src to upload generated content without writing
+              it to a file.
+        required: false
+        default: null
+    content_base64:
+        description:
+            - Base64 encoded binary data to upload as the blob content.
+        required: false
+        default: null
     content_type:
         description:
             - Set the blob content-type header. For example, 'image/png'.
@@ -81,19 +110,67 @@ options:
             - Set the blob md5 hash value.
         required: false
         default: null
+    min_age_days:
+        description:
+            - Use with state 'absent' and no blob value to only delete blobs last modified at least this many days
+              ago.
+        required: false
+        default: null
+    min_size:
+        description:
+            - Use with state 'absent' and no blob value to only delete blobs of at least this many bytes.
+        required: false
+        default: null
+    max_size:
+        description:
+            - Use with state 'absent' and no blob value to only delete blobs of at most this many bytes.
+        required: false
+        default: null
+    max_connections:
+        description:
+            - Maximum number of blocks, files or blob copies transferred at the same time. When uploading, at
+              most max_connections blocks are read ahead of the upload, so memory use is bounded by
+              max_connections times block_size.
+        required: false
+        default: 2
     dest:
         description:
             - Destination file path. Use with state 'present' to download a blob.
+            - A blob larger than block_size is downloaded in ranges of block_size, up to max_connections ranges at
+              a time, into a temporary file next to dest, which is renamed to dest once complete. Completed ranges
+              are recorded in a progress file, so that a failed download is resumed when the task is retried,
+              as long as the blob has not changed.
         aliases:
             - destination
         required: false
         default: null
+    dest_dir:
+        description:
+            - Destination directory. Use with state 'present' to download every blob whose name begins with prefix.
+              Files are saved under dest_dir at the blob name, less the prefix. A file is only downloaded when it
+              does not exist, or its size or MD5 hash differs from the blob. Use the force option to download all
+              blobs. Fails without downloading anything when a blob name contains empty, '.' or '..' segments, or
+              resolves to a path outside dest_dir.
+        required: false
+        default: null
     force:
         description:
             - Overwrite existing blob or file when uploading or downloading. Force deletion of a container
               that contains blobs.
         default: false
         required: false
+    prefix:
+        description:
+            - Blob name prefix used with src_dir, dest_dir and copy_source. For example, 'builds/1.2/'.
+            - Use with state 'absent' to delete the blobs beginning with prefix, rather than the container.
+        required: false
+        default: null
+    purge:
+        description:
+            - Use with src_dir to delete blobs beginning with prefix that have no matching file in src_dir,
+              or with dest_dir to delete files in dest_dir that have no matching blob.
+        required: false
+        default: false
     resource_group:
         description:
             - Name of the resource group to use.
@@ -101,16 +178,38 @@ options:
     src:
         description:
             - Source file path. Use with state 'present' to upload a blob.
+            - The path may also be a named pipe or a character device. The data is then uploaded in blocks of
+              block_size as it is read, and its MD5 hash is computed while reading, so that the data is never held
+              in memory or written to disk as a whole. With sync, data read from a pipe is always uploaded.
         aliases:
             - source
         required: false
         default: null
+    src_dir:
+        description:
+            - Source directory. Use with state 'present' to upload every file in the directory tree as a blob named
+              prefix followed by the file's path relative to src_dir. A file is only uploaded when no blob exists,
+              or the size or MD5 hash of the blob differs. Use the force option to upload all files.
+        required: false
+        default: null
+    sync:
+        description:
+            - Upload src only when the blob does not exist or its content differs. The MD5 hash of src is computed
+              by reading the file in chunks, and compared with the content_md5 of the blob. A blob is overwritten
+              when the hashes differ, without requiring the force option. Blobs uploaded with sync store the MD5
+              hash of src as their content_md5, unless content_md5 is provided. When the upload is skipped, only
+              the content settings provided are compared with, and updated on, the blob.
+        required: false
+        default: false
     state:
         description:
             - Assert the state of a container or blob.
             - Use state 'absent' with a container value only to delete a container. Include a blob value to remove
               a specific blob. A container will not be deleted, if it contains blobs. Use the force option to override,
               deleting the container and all associated blobs.
+            - Use state 'absent' with a prefix, min_age_days, min_size or max_size value, and no blob value, to delete
+              the matching blobs. The container is listed one page at a time, and the blobs of each page are deleted
+              up to max_connections at a time.
             - Use state 'present' to create or update a container and upload or download a blob. If the container
               does not exist, it will be created. If it exists, it will be updated with configuration options. Provide
               a blob name and either src or dest to upload or download. Provide a src path to upload and a dest path
@@ -170,6 +269,63 @@ EXAMPLES = '''
     public_access: container
     content_type: 'application/image'
 
+- name: Upload a large file, sending 8 blocks at a time
+  azure_rm_storageblob:
+    resource_group: Testing
+    storage_account_name: clh0002
+    container: vhds
+    blob: disk01.vhd
+    src: ./files/disk01.vhd
+    max_connections: 8
+
+- name: Upload generated content
+  azure_rm_storageblob:
+    resource_group: Testing
+    storage_account_name: clh0002
+    container: config
+    blob: settings.json
+    content: "{{ app_settings | to_json }}"
+    content_type: application/json
+    sync: yes
+
+- name: Upload a file only when its content changed
+  azure_rm_storageblob:
+    resource_group: Testing
+    storage_account_name: clh0002
+    container: artifacts
+    blob: app.tar.gz
+    src: ./dist/app.tar.gz
+    sync: yes
+
+- name: Publish a build directory, removing blobs of deleted files
+  azure_rm_storageblob:
+    resource_group: Testing
+    storage_account_name: clh0002
+    container: builds
+    src_dir: ./dist/
+    prefix: app/1.2/
+    purge: yes
+    max_connections: 16
+
+- name: Copy image VHDs from another storage account
+  azure_rm_storageblob:
+    resource_group: Testing
+    storage_account_name: clh0003
+    container: vhds
+    copy_source:
+      - "https://clh0002.blob.core.windows.net/vhds/web01.vhd?{{ sas_token }}"
+      - "https://clh0002.blob.core.windows.net/vhds/web02.vhd?{{ sas_token }}"
+
+- name: Remove build artifacts older than 30 days
+  azure_rm_storageblob:
+    resource_group: Testing
+    storage_account_name: clh0002
+    container: builds
+    prefix: app/
+    min_age_days: 30
+    max_connections: 16
+    state: absent
+
 - name: Download the file
   azure_rm_storageblob:
     resource_group: Testing
@@ -198,6 +354,7 @@ blob:
     type: dict
     sample: {
         "content_length": 136532,
+        "etag": "\"0x8D3485FD3A25D2A\"",
         "content_settings": {
             "cache_control": null,
             "content_disposition": null,
@@ -211,6 +368,49 @@ blob:
         "tags": {},
         "type": "BlockBlob"
     }
+transfer:
+    description: Size, number of blocks, duration and throughput of an upload or download. For a resumed download,
+                 only the blocks transferred by the task are counted.
+    returned: when a blob is uploaded or downloaded
+    type: dict
+    sample: {
+        "blocks": 33,
+        "bytes": 136532000,
+        "bytes_per_second": 22755333,
+        "elapsed": 6.0
+    }
+copies:
+    description: Result of each copy_source URL, without its query string.
+    returned: when copy_source is provided
+    type: list
+    sample: [
+        {
+            "blob": "web01.vhd",
+            "changed": true,
+            "elapsed": 42.17,
+            "source": "https://clh0002.blob.core.windows.net/vhds/web01.vhd",
+            "status": "success"
+        }
+    ]
+deleted:
+    description: Number and total size of the blobs deleted by state 'absent' with prefix or filters.
+    returned: when blobs are deleted by prefix or filters
+    type: dict
+    sample: {
+        "blobs": 1250,
+        "bytes": 8304221
+    }
+directory:
+    description: Number of files transferred, deleted and unchanged, and the bytes transferred, by src_dir or
+                 dest_dir.
+    returned: when src_dir or dest_dir is provided
+    type: dict
+    sample: {
+        "bytes": 1542,
+        "deleted": 1,
+        "transferred": 2,
+        "unchanged": 9997
+    }
 container:
     description: Facts about the current state of the selcted container.
     returned: always
@@ -223,16 +423,27 @@ container:
 '''
 
 
+import base64
+import calendar
 import datetime
 import hashlib
+import io
+import itertools
+import json
+import mimetypes
 import os
+import stat
+import threading
+import time
+import urllib
+import urlparse
 
 from ansible.module_utils.basic import *
 from ansible.module_utils.azure_rm_common import *
 
 
 try:
-    from azure.storage.blob.models import ContentSettings
+    from azure.storage.blob.models import BlobBlock, ContentSettings
     from azure.storage.cloudstorageaccount import CloudStorageAccount
     from azure.common import AzureMissingResourceHttpError, AzureHttpError
 except ImportError:
@@ -242,6 +453,37 @@ except ImportError:
 
 NAME_PATTERN = re.compile(r"^(?!-)(?!.*--)[a-z0-9\-]+$")
 
+MAX_BLOCK_SIZE = 4 * 1024 * 1024
+
+BLOCK_ID_FORMAT = 'block-{0:08d}'
+
+
+def get_file_md5(path, chunk_size=MAX_BLOCK_SIZE):
+    '''
+    Compute the MD5 hash of a file, reading it in chunks.
+
+    :param path: path of the file
+    :param chunk_size: number of bytes read at a time
+    :return: base64 encoded MD5 digest, as used by the content_md5 of a blob
+    '''
+    md5 = hashlib.md5()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b''):
+            md5.update(chunk)
+    return base64.b64encode(md5.digest())
+
+
+def get_block_ranges(size, block_size):
+    '''
+    Split size bytes into consecutive ranges of at most block_size bytes.
+
+    :param size: total number of bytes
+    :param block_size: maximum number of bytes in a range
+    :return: generator of (index, offset, length) tuples
+    '''
+    for index, offset in enumerate(range(0, size, block_size)):
+        yield index, offset, min(block_size, size - offset)
+
 
 class AzureRMStorageBlob(AzureRMModuleBase):
 
@@ -250,11 +492,17 @@ class AzureRMStorageBlob(AzureRMModuleBase):
         self.module_arg_spec = dict(
             storage_account_name=dict(required=True, type='str', aliases=['account_name']),
             blob=dict(type='str', aliases=['blob_name']),
+            block_size=dict(type='int', default=MAX_BLOCK_SIZE),
             container=dict(required=True, type='str', aliases=['container_name']),
+            content=dict(type='str'),
+            content_base64=dict(type='str'),
             dest=dict(type='str'),
+            dest_dir=dict(type='str'),
             force=dict(type='bool', default=False),
             resource_group=dict(required=True, type='str'),
             src=dict(type='str'),
+            src_dir=dict(type='str'),
+            sync=dict(type='bool', default=False),
             state=dict(type='str', default='present', choices=['absent', 'present']),
             public_access=dict(type='str', choices=['container', 'blob']),
             content_type=dict(type='str'),
@@ -263,22 +511,46 @@ class AzureRMStorageBlob(AzureRMModuleBase):
             content_disposition=dict(type='str'),
             cache_control=dict(type='str'),
             content_md5=dict(type='str'),
+            copy_source=dict(type='list'),
+            max_connections=dict(type='int', default=2),
+            min_age_days=dict(type='int'),
+            min_size=dict(type='int'),
+            max_size=dict(type='int'),
+            prefix=dict(type='str', default=''),
+            purge=dict(type='bool', default=False),
         )
 
-        mutually_exclusive = [('src', 'dest')]
+        mutually_exclusive = [('src', 'dest', 'src_dir', 'dest_dir', 'copy_source', 'content', 'content_base64'),
+                              ('blob', 'src_dir'),
+                              ('blob', 'dest_dir')]
 
         self.blob_client = None
         self.blob_details = None
         self.storage_account_name = None
         self.blob = None
         self.blob_obj = None
+        self.block_size = None
         self.container = None
         self.container_obj = None
+        self.content = None
+        self.content_base64 = None
+        self.content_data = None
+        self.copy_source = None
         self.dest = None
+        self.dest_dir = None
         self.force = None
+        self.max_connections = None
+        self.max_size = None
+        self.min_age_days = None
+        self.min_size = None
+        self.prefix = None
+        self.purge = None
         self.resource_group = None
         self.src = None
+        self.src_dir = None
+        self.src_md5 = None
         self.state = None
+        self.sync = None
         self.tags = None
         self.public_access = None
         self.results = dict(
@@ -305,6 +577,32 @@ class AzureRMStorageBlob(AzureRMModuleBase):
                       "numbers and hyphens. It must begin with a letter or number. It may "
                       "not contain two consecutive hyphens.")
 
+        if self.block_size < 1 or self.block_size > MAX_BLOCK_SIZE:
+            self.fail("Parameter error: block_size must be between 1 and {0}.".format(MAX_BLOCK_SIZE))
+
+        if self.max_connections < 1:
+            self.fail("Parameter error: max_connections must be at least 1.")
+
+        if self.content is not None or self.content_base64 is not None:
+            if not self.blob:
+                self.fail("Parameter error: blob is required with content and content_base64.")
+            if self.content_base64 is not None:
+                try:
+                    self.content_data = base64.b64decode(self.content_base64)
+                except TypeError as exc:
+                    self.fail("Parameter error: content_base64 is not valid base64 - {0}".format(str(exc)))
+            else:
+                self.content_data = self.content.encode('utf-8') if isinstance(self.content, unicode) \
+                    else self.content
+
+        if self.src_dir:
+            self.src_dir = os.path.expandvars(os.path.expanduser(self.src_dir))
+            if not os.path.isdir(self.src_dir):
+                self.fail("The source path {0} must be a directory.".format(self.src_dir))
+
+        if self.dest_dir:
+            self.dest_dir = os.path.expandvars(os.path.expanduser(self.dest_dir))
+
         # add file path validation
 
         self.blob_client = self.get_blob_client(self.resource_group, self.storage_account_name)
@@ -323,10 +621,23 @@ class AzureRMStorageBlob(AzureRMModuleBase):
                 if update_tags:
                     self.update_container_tags(self.container_obj['tags'])
 
+            if self.src_dir or self.dest_dir:
+                self.sync_directory()
+
+            if self.copy_source:
+                self.copy_blobs()
+                if self.blob:
+                    self.blob_obj = self.get_blob()
+
             if self.blob:
                 # create, update or download blob
-                if self.src and self.src_is_valid():
-                    if self.blob_obj and not self.force:
+                if (self.src and self.src_is_valid()) or self.content_data is not None:
+                    if self.sync:
+                        self.src_md5 = self.get_source_md5()
+                    if self.blob_obj and self.sync and self.src_md5 and \
+                            self.blob_obj['content_settings']['content_md5'] == self.src_md5:
+                        self.log("Blob {0} matches {1}. Skipping upload.".format(self.blob, self.src or 'content'))
+                    elif self.blob_obj and not self.force and not self.sync:
                         self.log("Cannot upload to {0}. Blob with that name already exists. "
                             "Use the force option".format(self.blob))
                     else:
@@ -342,7 +653,11 @@ class AzureRMStorageBlob(AzureRMModuleBase):
                     self.update_blob_content_settings()
 
         elif self.state == 'absent':
-            if self.container_obj and not self.blob:
+            if self.container_obj and not self.blob and (self.prefix or self.min_age_days is not None or
+                                                         self.min_size is not None or self.max_size is not None):
+                # Delete matching blobs
+                self.delete_blobs()
+            elif self.container_obj and not self.blob:
                 # Delete container
                 if self.container_has_blobs():
                     if self.force:
@@ -358,6 +673,250 @@ class AzureRMStorageBlob(AzureRMModuleBase):
 
         return self.results
 
+    def delete_blobs(self):
+        '''
+        Delete the blobs beginning with prefix that match the min_age_days, min_size and max_size filters. The
+        container is listed one page at a time, and each page is deleted before the next is listed.
+        '''
+        count = 0
+        size = 0
+        for page, marker in list_blob_pages(self.blob_client, self.container, prefix=self.prefix or None):
+            blobs = [blob for blob in page if self.blob_matches_filters(blob)]
+            results = run_parallel(self.delete_directory_blob, [blob.name for blob in blobs], self.max_connections)
+            errors = [str(error) for result, error in results if error]
+            if errors:
+                self.fail("Error deleting {0} blobs from {1} - {2}".format(len(errors), self.container, errors[0]))
+            count += len(blobs)
+            size += sum(blob.properties.content_length for blob in blobs)
+
+        self.results['deleted'] = dict(blobs=count, bytes=size)
+        if count:
+            self.results['changed'] = True
+            self.results['actions'].append("deleted {0} blobs from {1}:{2}".format(count, self.container,
+                                                                                   self.prefix))
+        self.results['container'] = self.container_obj
+
+    def blob_matches_filters(self, blob):
+        if self.min_size is not None and blob.properties.content_length < self.min_size:
+            return False
+        if self.max_size is not None and blob.properties.content_length > self.max_size:
+            return False
+        if self.min_age_days is not None:
+            age = time.time() - calendar.timegm(blob.properties.last_modified.utctimetuple())
+            if age < self.min_age_days * 86400:
+                return False
+        return True
+
+    def sync_directory(self):
+        '''
+        Upload src_dir to, or download dest_dir from, the blobs beginning with prefix. The container is listed once,
+        and files are compared and transferred by up to max_connections workers.
+        '''
+        blobs = dict()
+        try:
+            # in check mode a new container does not exist yet
+            pages = list_blob_pages(self.blob_client, self.container, prefix=self.prefix or None) \
+                if self.container_obj else []
+            for page, marker in pages:
+                for blob in page:
+                    if not blob.name.endswith('/'):
+                        blobs[blob.name] = dict(size=blob.properties.content_length,
+                                                content_md5=blob.properties.content_settings.content_md5)
+        except AzureHttpError as exc:
+            self.fail("Error listing blobs in {0} - {1}".format(self.container, str(exc)))
+
+        if self.src_dir:
+            source, target = self.src_dir, "{0}:{1}".format(self.container, self.prefix)
+            files = self.get_directory_files(self.src_dir)
+            results = run_parallel(self.upload_directory_file,
+                                   ((name, files[name], blobs.get(name)) for name in sorted(files)),
+                                   self.max_connections)
+            extra = [name for name in sorted(blobs) if name not in files]
+            delete = self.delete_directory_blob
+        else:
+            source, target = "{0}:{1}".format(self.container, self.prefix), self.dest_dir
+            files = self.get_directory_files(self.dest_dir) if os.path.isdir(self.dest_dir) else dict()
+            paths = dict((name, self.get_download_path(name)) for name in blobs)
+            invalid = [name for name in sorted(paths) if not paths[name]]
+            if invalid:
+                self.fail("Error synchronizing {0} files from {1} to {2} - blob {3} is not a valid path "
+                          "in the destination directory".format(len(invalid), source, target, invalid[0]))
+            results = run_parallel(self.download_directory_file,
+                                   ((name, paths[name], blobs[name]) for name in sorted(blobs)),
+                                   self.max_connections)
+            extra = [files[name] for name in sorted(files) if name not in blobs]
+            delete = self.delete_directory_file
+
+        if not self.purge:
+            extra = []
+        deleted = run_parallel(delete, extra, self.max_connections)
+
+        errors = [str(error) for result, error in results + deleted if error]
+        if errors:
+            self.fail("Error synchronizing {0} files from {1} to {2} - {3}".format(len(errors), source, target,
+                                                                                   errors[0]))
+
+        transferred = [size for size in [result for result, error in results] if size is not None]
+        self.results['directory'] = dict(
+            transferred=len(transferred),
+            deleted=len(deleted),
+            unchanged=len(results) - len(transferred),
+            bytes=sum(transferred)
+        )
+        if transferred:
+            self.results['changed'] = True
+            self.results['actions'].append("copied {0} files from {1} to {2}".format(len(transferred), source,
+                                                                                     target))
+        if deleted:
+            self.results['changed'] = True
+            self.results['actions'].append("deleted {0} files from {1}".format(len(deleted), target))
+        self.results['container'] = self.container_obj
+
+    def copy_blobs(self):
+        '''
+        Copy each copy_source URL into the container, up to max_connections at a time, and wait for the copies
+        to complete.
+        '''
+        if self.blob:
+            if len(self.copy_source) != 1:
+                self.fail("Parameter error: copy_source must contain a single URL when blob is provided.")
+            copies = [(self.blob, self.copy_source[0])]
+        else:
+            copies = [(self.prefix + urllib.unquote(urlparse.urlparse(url).path.split('/', 2)[-1]), url)
+                      for url in self.copy_source]
+
+        results = run_parallel(self.copy_blob, copies, self.max_connections)
+        errors = [str(error) for result, error in results if error]
+        if errors:
+            self.fail("Error copying {0} of {1} blobs to {2} - {3}".format(len(errors), len(copies), self.container,
+                                                                          errors[0]))
+
+        self.results['copies'] = [result for result, error in results]
+        copied = [result for result in self.results['copies'] if result['changed']]
+        if copied:
+            self.results['changed'] = True
+            self.results['actions'].append("copied {0} blobs to {1}".format(len(copied), self.container))
+        self.results['container'] = self.container_obj
+
+    def copy_blob(self, entry):
+        '''
+        Start a server side copy, unless the blob was already copied from the same source, and poll the copy status,
+        backing off like long running operations, until it is no longer pending.
+
+        :param entry: tuple of blob name and source URL
+        :return: dict describing the copy
+        '''
+        name, url = entry
+        source = url.split('?')[0]
+        start = time.time()
+        changed = False
+        try:
+            copy = self.blob_client.get_blob_properties(self.container, name).properties.copy
+        except AzureMissingResourceHttpError:
+            copy = None
+
+        if self.force or not copy or not copy.source or copy.source.split('?')[0] != source or \
+                copy.status not in ('pending', 'success'):
+            changed = True
+            if self.check_mode:
+                return dict(blob=name, source=source, status='pending', changed=changed, elapsed=0)
+            copy = self.blob_client.copy_blob(self.container, name, url, metadata=self.tags)
+
+        delay = self.poller_initial_delay
+        while copy.status == 'pending':
+            time.sleep(delay)
+            delay = min(delay * self.poller_backoff, self.poller_max_delay)
+            copy = self.blob_client.get_blob_properties(self.container, name).properties.copy
+
+        if copy.status != 'success':
+            raise Exception("copy of {0} to {1} {2} - {3}".format(source, name, copy.status,
+                                                                 copy.status_description))
+        return dict(blob=name, source=source, status=copy.status, changed=changed,
+                    elapsed=round(time.time() - start, 2))
+
+    def get_directory_files(self, path):
+        '''
+        Map the blob name of each file in a directory tree to the file path.
+
+        :param path: directory path
+        :return: dict of blob name: file path
+        '''
+        files = dict()
+        for root, dirs, names in os.walk(path):
+            for name in names:
+                file_path = os.path.join(root, name)
+                relative_path = os.path.relpath(file_path, path).replace(os.sep, '/')
+                files[self.prefix + relative_path] = file_path
+        return files
+
+    def upload_directory_file(self, entry):
+        '''
+        Upload a file of src_dir, unless the blob has the same size and MD5 hash.
+
+        :param entry: tuple of blob name, file path and blob size and MD5 hash dict, or None
+        :return: bytes uploaded, or None when the blob is unchanged
+        '''
+        name, path, blob = entry
+        size = os.path.getsize(path)
+        content_md5 = get_file_md5(path, self.block_size)
+        if blob and blob['size'] == size and blob['content_md5'] == content_md5 and not self.force:
+            return None
+        if not self.check_mode:
+            content_settings = ContentSettings(content_type=self.content_type or mimetypes.guess_type(path)[0],
+                                               content_encoding=self.content_encoding,
+                                               content_language=self.content_language,
+                                               content_disposition=self.content_disposition,
+                                               cache_control=self.cache_control,
+                                               content_md5=content_md5)
+            self.blob_client.create_blob_from_path(self.container, name, path, metadata=self.tags,
+                                                   content_settings=content_settings, max_connections=1)
+        return size
+
+    def download_directory_file(self, entry):
+        '''
+        Download a blob to dest_dir, unless the file has the same size and MD5 hash.
+
+        :param entry: tuple of blob name, file path returned by get_download_path, and blob size and MD5 hash dict
+        :return: bytes downloaded, or None when the file is unchanged
+        '''
+        name, path, blob = entry
+        if os.path.isfile(path) and not self.force and os.path.getsize(path) == blob['size'] and \
+                (not blob['content_md5'] or get_file_md5(path, self.block_size) == blob['content_md5']):
+            return None
+        if not self.check_mode:
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                if not os.path.isdir(os.path.dirname(path)):
+                    raise
+            self.blob_client.get_blob_to_path(self.container, name, path, max_connections=1)
+        return blob['size']
+
+    def get_download_path(self, name):
+        '''
+        Get the path a blob is downloaded to in dest_dir. Blob names with empty, '.' or '..' segments, and paths
+        leaving dest_dir through a symbolic link, are rejected.
+
+        :param name: blob name
+        :return: real path of the file, or None when the blob name is not a valid path in dest_dir
+        '''
+        segments = name[len(self.prefix):].split('/')
+        if any(segment in ('', '.', '..') for segment in segments):
+            return None
+        dest_dir = os.path.realpath(self.dest_dir)
+        path = os.path.realpath(os.path.join(dest_dir, *segments))
+        if not path.startswith(dest_dir.rstrip(os.sep) + os.sep):
+            return None
+        return path
+
+    def delete_directory_blob(self, name):
+        if not self.check_mode:
+            self.blob_client.delete_blob(self.container, name)
+
+    def delete_directory_file(self, path):
+        if not self.check_mode:
+            os.remove(path)
+
     def get_container(self):
         result  = dict()
         container = None
@@ -389,6 +948,7 @@ class AzureRMStorageBlob(AzureRMModuleBase):
                 last_modified=blob.properties.last_modified.strftime('%d-%b-%Y %H:%M:%S %z'),
                 type=blob.properties.blob_type,
                 content_length=blob.properties.content_length,
+                etag=blob.properties.etag,
                 content_settings=dict(
                     content_type=blob.properties.content_settings.content_type,
                     content_encoding=blob.properties.content_settings.content_encoding,
@@ -420,38 +980,162 @@ class AzureRMStorageBlob(AzureRMModuleBase):
 
     def upload_blob(self):
         content_settings = None
+        content_md5 = self.content_md5 or self.src_md5
         if self.content_type or self.content_encoding or self.content_language or self.content_disposition or \
-                self.cache_control or self.content_md5:
+                self.cache_control or content_md5:
             content_settings = ContentSettings(
                 content_type=self.content_type,
                 content_encoding=self.content_encoding,
                 content_language=self.content_language,
                 content_disposition=self.content_disposition,
                 cache_control=self.cache_control,
-                content_md5=self.content_md5
+                content_md5=content_md5
             )
         if not self.check_mode:
+            start = time.time()
             try:
-                self.blob_client.create_blob_from_path(self.container, self.blob, self.src,
-                                                       metadata=self.tags, content_settings=content_settings)
+                if self.content_data is not None and len(self.content_data) <= self.block_size:
+                    size, blocks = len(self.content_data), 1
+                    self.blob_client.create_blob_from_bytes(self.container, self.blob, self.content_data,
+                                                            metadata=self.tags, content_settings=content_settings)
+                elif self.content_data is not None:
+                    size, blocks = self.upload_stream(io.BytesIO(self.content_data), content_settings)
+                elif not os.path.isfile(self.src):
+                    with open(self.src, 'rb') as stream:
+                        size, blocks = self.upload_stream(stream, content_settings)
+                else:
+                    size = os.path.getsize(self.src)
+                    blocks = 1
+                    if size <= self.block_size:
+                        self.blob_client.create_blob_from_path(self.container, self.blob, self.src,
+                                                               metadata=self.tags, content_settings=content_settings,
+                                                               max_connections=self.max_connections)
+                    else:
+                        blocks = self.upload_blocks(size, content_settings)
             except AzureHttpError as exc:
                 self.fail("Error creating blob {0} - {1}".format(self.blob, str(exc)))
+            self.results['transfer'] = self.get_transfer_stats(size, blocks, time.time() - start)
 
         self.blob_obj = self.get_blob()
         self.results['changed'] = True
-        self.results['actions'].append('created blob {0} from {1}'.format(self.blob, self.src))
+        self.results['actions'].append('created blob {0} from {1}'.format(self.blob, self.src or 'content'))
         self.results['container'] = self.container_obj
         self.results['blob'] = self.blob_obj
 
+    def upload_blocks(self, size, content_settings):
+        '''
+        Upload src in blocks of block_size, up to max_connections blocks at a time, and commit the block list.
+        Each block is read from the file when it is sent, so only the blocks in flight are held in memory.
+
+        :param size: size of src in bytes
+        :param content_settings: ContentSettings to commit with the block list
+        :return: number of blocks uploaded
+        '''
+        count = (size + self.block_size - 1) // self.block_size
+
+        def put_block(block_range):
+            index, offset, length = block_range
+            with open(self.src, 'rb') as fp:
+                fp.seek(offset)
+                data = fp.read(length)
+            block_id = BLOCK_ID_FORMAT.format(index)
+            self.blob_client.put_block(self.container, self.blob, data, block_id)
+            self.log("Uploaded block {0} of {1} to {2}:{3}".format(index + 1, count, self.container, self.blob))
+            return block_id
+
+        results = run_parallel(put_block, get_block_ranges(size, self.block_size), self.max_connections)
+        errors = [str(error) for result, error in results if error]
+        if errors:
+            self.fail("Error uploading blocks to blob {0} - {1}".format(self.blob, errors[0]))
+
+        self.blob_client.put_block_list(self.container, self.blob,
+                                        [BlobBlock(id=block_id) for block_id, error in results],
+                                        content_settings=content_settings, metadata=self.tags)
+        return count
+
+    def upload_stream(self, stream, content_settings):
+        '''
+        Upload a stream in blocks of block_size as it is read, up to max_connections blocks at a time, and commit
+        the block list with the MD5 hash computed while reading, unless content_md5 is set. A block is only read
+        once fewer than max_connections blocks are pending, so memory use is bounded by max_connections times
+        block_size.
+
+        :param stream: file like object to read
+        :param content_settings: ContentSettings to commit with the block list, or None
+        :return: tuple of the bytes and the number of blocks uploaded
+        '''
+        md5 = hashlib.md5()
+        sizes = []
+
+        def read_blocks():
+            for index in itertools.count():
+                data = stream.read(self.block_size)
+                if not data:
+                    return
+                md5.update(data)
+                sizes.append(len(data))
+                yield index, data
+
+        def put_block(block):
+            index, data = block
+            block_id = BLOCK_ID_FORMAT.format(index)
+            self.blob_client.put_block(self.container, self.blob, data, block_id)
+            self.log("Uploaded block {0} to {1}:{2}".format(index + 1, self.container, self.blob))
+            return block_id
+
+        results = run_parallel(put_block, read_blocks(), self.max_connections)
+        errors = [str(error) for result, error in results if error]
+        if errors:
+            self.fail("Error uploading blocks to blob {0} - {1}".format(self.blob, errors[0]))
+
+        content_settings = content_settings or ContentSettings()
+        content_settings.content_md5 = content_settings.content_md5 or base64.b64encode(md5.digest())
+        self.blob_client.put_block_list(self.container, self.blob,
+                                        [BlobBlock(id=block_id) for block_id, error in results],
+                                        content_settings=content_settings, metadata=self.tags)
+        return sum(sizes), len(results)
+
+    def get_source_md5(self):
+        '''
+        Compute the MD5 hash of content, or of src when it is a regular file.
+
+        :return: base64 encoded MD5 digest, or None when src is a pipe or device
+        '''
+        if self.content_data is not None:
+            return base64.b64encode(hashlib.md5(self.content_data).digest())
+        if os.path.isfile(self.src):
+            return get_file_md5(self.src, self.block_size)
+        return None
+
+    def get_transfer_stats(self, size, blocks, elapsed):
+        return dict(
+            bytes=size,
+            blocks=blocks,
+            elapsed=round(elapsed, 2),
+            bytes_per_second=int(size / elapsed) if elapsed else size
+        )
+
     def download_blob(self):
+        if not self.blob_obj:
+            self.fail("Failed to download blob {0}:{1} to {2} - blob not found".format(self.container,
+                                                                                      self.blob,
+                                                                                      self.dest))
         if not self.check_mode:
+            size = self.blob_obj['content_length']
+            blocks = 1
+            start = time.time()
             try:
-                self.blob_client.get_blob_to_path(self.container, self.blob, self.dest)
+                if size <= self.block_size:
+                    self.blob_client.get_blob_to_path(self.container, self.blob, self.dest,
+                                                      max_connections=self.max_connections)
+                else:
+                    size, blocks = self.download_ranges(size)
             except Exception as exc:
                 self.fail("Failed to download blob {0}:{1} to {2} - {3}".format(self.container,
                                                                                 self.blob,
                                                                                 self.dest,
                                                                                 exc))
+            self.results['transfer'] = self.get_transfer_stats(size, blocks, time.time() - start)
         self.results['changed'] = True
         self.results['actions'].append('downloaded blob {0}:{1} to {2}'.format(self.container,
                                                                                self.blob,
@@ -460,13 +1144,90 @@ class AzureRMStorageBlob(AzureRMModuleBase):
         self.results['container'] = self.container_obj
         self.results['blob'] = self.blob_obj
 
+    def download_ranges(self, size):
+        '''
+        Download the blob in ranges of block_size, up to max_connections ranges at a time, writing each range at its
+        offset in dest.part. Completed ranges are appended to dest.progress, after a header identifying the blob,
+        so that a retried download skips them. Once every range is written, dest.part is renamed to dest.
+
+        :param size: size of the blob in bytes
+        :return: tuple of the bytes and the number of ranges downloaded
+        '''
+        part_path = self.dest + '.part'
+        progress_path = self.dest + '.progress'
+        header = dict(etag=self.blob_obj['etag'], size=size, block_size=self.block_size)
+        completed = self.read_download_progress(part_path, progress_path, header)
+
+        if not completed:
+            with open(part_path, 'wb') as fp:
+                fp.truncate(size)
+            with open(progress_path, 'w') as fp:
+                fp.write(json.dumps(header) + '\n')
+        else:
+            self.log("Resuming download of {0}:{1} with {2} ranges completed".format(self.container, self.blob,
+                                                                                    len(completed)))
+
+        progress_lock = threading.Lock()
+
+        def get_range(block_range):
+            index, offset, length = block_range
+            blob = self.blob_client.get_blob_to_bytes(self.container, self.blob, start_range=offset,
+                                                      end_range=offset + length - 1, if_match=header['etag'])
+            with open(part_path, 'r+b') as fp:
+                fp.seek(offset)
+                fp.write(blob.content)
+                fp.flush()
+                os.fsync(fp.fileno())
+            with progress_lock:
+                with open(progress_path, 'a') as fp:
+                    fp.write('{0}\n'.format(index))
+            return length
+
+        ranges = [block_range for block_range in get_block_ranges(size, self.block_size)
+                  if block_range[0] not in completed]
+        results = run_parallel(get_range, ranges, self.max_connections)
+        errors = [str(error) for result, error in results if error]
+        if errors:
+            raise Exception("{0} of {1} ranges failed, retry to resume the download - {2}".format(
+                len(errors), len(ranges), errors[0]))
+
+        os.rename(part_path, self.dest)
+        os.remove(progress_path)
+        return sum(result for result, error in results), len(ranges)
+
+    def read_download_progress(self, part_path, progress_path, header):
+        '''
+        Read the ranges completed by a previous download of the same blob.
+
+        :param part_path: path of the partial file
+        :param progress_path: path of the progress file
+        :param header: dict identifying the blob and range size
+        :return: set of completed range indexes, empty when there is nothing to resume
+        '''
+        completed = set()
+        if not os.path.isfile(part_path) or os.path.getsize(part_path) != header['size']:
+            return completed
+        try:
+            with open(progress_path) as fp:
+                if json.loads(fp.readline()) != header:
+                    return completed
+                for line in fp:
+                    # a line without a newline was cut short
+                    if line.endswith('\n') and line.strip().isdigit():
+                        completed.add(int(line))
+        except (IOError, ValueError):
+            pass
+        return completed
+
     def src_is_valid(self):
-        if not os.path.isfile(self.src):
-            self.fail("The source path must be a file.")
         try:
-            fp = open(self.src, 'r')
-            fp.close()
-        except IOError:
+            mode = os.stat(self.src).st_mode
+        except OSError:
+            mode = None
+        if mode is None or not (stat.S_ISREG(mode) or stat.S_ISFIFO(mode) or stat.S_ISCHR(mode)):
+            self.fail("The source path must be a file, a named pipe or a character device.")
+        # opening a pipe would wait for a writer, so only check permissions
+        if not os.access(self.src, os.R_OK):
             self.fail("Failed to access {0}. Make sure the file exists and that you have "
                       "read access.".format(self.src))
         return True
@@ -517,12 +1278,9 @@ class AzureRMStorageBlob(AzureRMModuleBase):
 
     def container_has_blobs(self):
         try:
-            list_generator = self.blob_client.list_blobs(self.container)
+            return self.blob_container_has_blobs(self.blob_client, self.container)
         except AzureHttpError as exc:
             self.fail("Error list blobs in {0} - {1}".format(self.container, str(exc)))
-        if len(list_generator.items) > 0:
-            return True
-        return False
 
     def delete_blob(self):
         if not self.check_mode:
@@ -569,13 +1327,17 @@ class AzureRMStorageBlob(AzureRMModuleBase):
                 cache_control=self.cache_control,
                 content_md5=self.content_md5
             )
+            if self.sync:
+                # only compare the settings provided
+                settings = dict((key, value) for key, value in settings.items() if value is not None)
+                return any(self.blob_obj['content_settings'].get(key) != value for key, value in settings.items())
             if self.blob_obj['content_settings'] != settings:
                 return True
 
         return False
 
     def update_blob_content_settings(self):
-        content_settings = ContentSettings(
+        settings = dict(
             content_type=self.content_type,
             content_encoding=self.content_encoding,
             content_language=self.content_language,
@@ -583,6 +1345,12 @@ class AzureRMStorageBlob(AzureRMModuleBase):
             cache_control=self.cache_control,
             content_md5=self.content_md5
         )
+        if self.sync:
+            # keep the settings of the blob that are not provided
+            for key in settings:
+                if settings[key] is None:
+                    settings[key] = self.blob_obj['content_settings'].get(key)
+        content_settings = ContentSettings(**settings)
         if not self.check_mode:
             try:
                 self.blob_client.set_blob_properties(self.container, self.blob, content_settings=content_settings)
@@ -0,0 +1,265 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2016 Matt Davis, <mdavis@ansible.com>
+#                    Chris Houseknecht, <house@redhat.com>
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+DOCUMENTATION = '''
+---
+module: azure_rm_storageblob_facts
+
+version_added: "2.2"
+
+short_description: Get blob facts.
+
+description:
+    - Get facts for the blobs within a blob container. Blobs are listed one page at a time, up to max_results
+      blobs per task. Pass the returned next_marker as marker to get the following blobs.
+
+options:
+    resource_group:
+        description:
+            - Name of the resource group containing the storage account.
+        required: true
+    storage_account_name:
+        description:
+            - Name of the storage account.
+        required: true
+        aliases:
+            - account_name
+    container:
+        description:
+            - Name of the blob container.
+        required: true
+        aliases:
+            - container_name
+    prefix:
+        description:
+            - Only show blobs with names beginning with prefix.
+        required: false
+        default: null
+    delimiter:
+        description:
+            - Group blobs with names sharing a prefix up to the delimiter, for example '/', and return the prefix in
+              prefixes rather than the blobs.
+        required: false
+        default: null
+    max_results:
+        description:
+            - Maximum number of blobs and prefixes to return.
+        required: false
+        default: 5000
+    marker:
+        description:
+            - Continue a previous listing from the next_marker it returned.
+        required: false
+        default: null
+    fields:
+        description:
+            - Only return these facts for each blob. Blob metadata is only requested when tags is included.
+        required: false
+        default: [name, type, content_length, last_modified, etag, content_type, content_md5, tags]
+        choices:
+            - name
+            - type
+            - content_length
+            - last_modified
+            - etag
+            - content_type
+            - content_md5
+            - tags
+
+extends_documentation_fragment:
+    - azure
+
+author:
+    - "Chris Houseknecht (@chouseknecht)"
+    - "Matt Davis (@nitzmahone)"
+
+'''
+
+EXAMPLES = '''
+    - name: Get facts for the blobs in a container
+      azure_rm_storageblob_facts:
+        resource_group: Testing
+        storage_account_name: clh0002
+        container: foo
+
+    - name: Get the names and sizes of build artifacts, 1000 at a time
+      azure_rm_storageblob_facts:
+        resource_group: Testing
+        storage_account_name: clh0002
+        container: builds
+        prefix: app/
+        max_results: 1000
+        marker: "{{ previous.next_marker | default(omit) }}"
+        fields:
+          - name
+          - content_length
+
+    - name: List the top level folders of a container
+      azure_rm_storageblob_facts:
+        resource_group: Testing
+        storage_account_name: clh0002
+        container: builds
+        delimiter: /
+        fields:
+          - name
+'''
+
+RETURN = '''
+changed:
+    description: Whether or not the object was changed.
+    returned: always
+    type: bool
+    sample: False
+objects:
+    description: List containing the selected facts for each blob.
+    returned: always
+    type: list
+    sample: [{
+        "content_length": 136532,
+        "content_md5": "dNhkLzuSC3/3HiH0vVuDpA==",
+        "content_type": "image/png",
+        "etag": "\\"0x8D3485FD3A25D2A\\"",
+        "last_modified": "09-Mar-2016 22:08:25 +0000",
+        "name": "graylog.png",
+        "tags": {},
+        "type": "BlockBlob"
+    }]
+prefixes:
+    description: List of blob name prefixes up to the delimiter.
+    returned: always
+    type: list
+    sample: [
+        "app/",
+        "docs/"
+    ]
+next_marker:
+    description: Marker to pass to continue the listing, or null when all blobs have been returned.
+    returned: always
+    type: str
+    sample: "2!80!MDAwMDEzIWZpbGVzL2dyYXlsb2cucG5nITAwMDAyOCE5OTk5LTEyLTMxVDIzOjU5OjU5Ljk5OTk5OTlaIQ--"
+'''
+
+from ansible.module_utils.basic import *
+from ansible.module_utils.azure_rm_common import *
+
+try:
+    from azure.common import AzureHttpError
+except:
+    # This is handled in azure_rm_common
+    pass
+
+
+BLOB_FIELDS = dict(
+    name=lambda blob: blob.name,
+    type=lambda blob: blob.properties.blob_type,
+    content_length=lambda blob: blob.properties.content_length,
+    last_modified=lambda blob: blob.properties.last_modified.strftime('%d-%b-%Y %H:%M:%S %z'),
+    etag=lambda blob: blob.properties.etag,
+    content_type=lambda blob: blob.properties.content_settings.content_type,
+    content_md5=lambda blob: blob.properties.content_settings.content_md5,
+    tags=lambda blob: blob.metadata,
+)
+
+
+class AzureRMStorageBlobFacts(AzureRMModuleBase):
+
+    def __init__(self):
+
+        self.module_arg_spec = dict(
+            resource_group=dict(type='str', required=True),
+            storage_account_name=dict(type='str', required=True, aliases=['account_name']),
+            container=dict(type='str', required=True, aliases=['container_name']),
+            prefix=dict(type='str'),
+            delimiter=dict(type='str'),
+            max_results=dict(type='int', default=AZURE_BLOB_PAGE_SIZE),
+            marker=dict(type='str'),
+            fields=dict(type='list', default=sorted(BLOB_FIELDS.keys())),
+        )
+
+        self.results = dict(
+            changed=False,
+            objects=[],
+            prefixes=[],
+            next_marker=None
+        )
+
+        self.resource_group = None
+        self.storage_account_name = None
+        self.container = None
+        self.prefix = None
+        self.delimiter = None
+        self.max_results = None
+        self.marker = None
+        self.fields = None
+
+        super(AzureRMStorageBlobFacts, self).__init__(self.module_arg_spec,
+                                                      supports_tags=False,
+                                                      facts_module=True)
+
+    def exec_module(self, **kwargs):
+
+        for key in self.module_arg_spec:
+            setattr(self, key, kwargs[key])
+
+        unknown = [field for field in self.fields if field not in BLOB_FIELDS]
+        if unknown:
+            self.fail("Parameter error: unsupported fields {0}. Expecting one of {1}.".format(
+                ', '.join(unknown), ', '.join(sorted(BLOB_FIELDS.keys()))))
+
+        if self.max_results < 1:
+            self.fail("Parameter error: max_results must be at least 1.")
+
+        self.list_blobs()
+        return self.results
+
+    def list_blobs(self):
+        self.log('List blobs in {0}'.format(self.container))
+        blob_client = self.get_blob_client(self.resource_group, self.storage_account_name)
+        include = 'metadata' if 'tags' in self.fields else None
+        marker = self.marker
+        remaining = self.max_results
+        try:
+            while remaining > 0:
+                # request no more than the blobs still needed, so the listing stops where next_marker continues
+                pages = list_blob_pages(blob_client, self.container, prefix=self.prefix,
+                                        page_size=min(remaining, AZURE_BLOB_PAGE_SIZE), marker=marker,
+                                        delimiter=self.delimiter, include=include)
+                page, marker = next(pages)
+                for blob in page:
+                    if hasattr(blob, 'properties'):
+                        self.results['objects'].append(dict((field, BLOB_FIELDS[field](blob))
+                                                            for field in self.fields))
+                    else:
+                        # BlobPrefix
+                        self.results['prefixes'].append(blob.name)
+                remaining -= len(page)
+                if not marker:
+                    break
+        except AzureHttpError as exc:
+            self.fail("Error listing blobs in {0} - {1}".format(self.container, str(exc)))
+        self.results['next_marker'] = marker
+
+
+def main():
+    AzureRMStorageBlobFacts()
+
+if __name__ == '__main__':
+    main()
@@ -41,8 +41,23 @@ options:
         required: true
     name:
         description:
-            - Name of the virtual machine.
-        required: true
+            - Name of the virtual machine. Required, unless vms is provided.
+        default: null
+        required: false
+    vms:
+        description:
+            - List of virtual machines to manage in a single task. Each item is a dictionary that must contain a name
+              key, and may set any other option of this module, except tags and purge_tags, to override the value
+              set for the task. Options are checked and converted like task options, and may use their aliases.
+              admin_password values are hidden in the results. Settings shared by the virtual machines, such as
+              vm_size and image, are validated once. Mutually exclusive with name.
+        default: null
+        required: false
+    max_concurrent_vms:
+        description:
+            - When using vms, the maximum number of virtual machines created, updated or deleted at the same time.
+        default: 10
+        required: false
     state:
         description:
             - Assert the state of the virtual machine.
@@ -279,6 +294,24 @@ EXAMPLES = '''
       sku: '7.1'
       version: latest
 
+- name: Create a tier of VMs sharing common settings
+  azure_rm_virtualmachine:
+    resource_group: Testing
+    admin_username: chouseknecht
+    admin_password: <your password here>
+    vm_size: Standard_D1
+    image:
+      offer: CentOS
+      publisher: OpenLogic
+      sku: '7.1'
+      version: latest
+    vms:
+      - name: web01
+      - name: web02
+      - name: web03
+        vm_size: Standard_D2
+    max_concurrent_vms: 5
+
 - name: Power Off
   azure_rm_virtualmachine:
     resource_group: Testing
@@ -317,6 +350,21 @@ powerstate:
     returned: always
     type: string
     sample: running
+vms:
+    description: Results for each virtual machine when using vms. Each item contains the name, changed, actions,
+                 powerstate_change and state keys of a single virtual machine, or failed and msg for a virtual machine
+                 that could not be managed.
+    returned: when vms is provided
+    type: list
+    sample: [
+        {
+            "actions": ["Created VM web01"],
+            "changed": true,
+            "name": "web01",
+            "powerstate_change": null,
+            "state": {}
+        }
+    ]
 state:
     description: Facts about the current state of the object.
     returned: always
@@ -447,7 +495,11 @@ state:
     }
 '''
 
+import copy
 import random
+import threading
+
+from functools import partial
 
 from ansible.module_utils.basic import *
 from ansible.module_utils.azure_rm_common import *
@@ -487,7 +539,9 @@ class AzureRMVirtualMachine(AzureRMModuleBase):
 
         self.module_arg_spec = dict(
             resource_group=dict(type='str', required=True),
-            name=dict(type='str', required=True),
+            name=dict(type='str'),
+            vms=dict(type='list'),
+            max_concurrent_vms=dict(type='int', default=10),
             state=dict(choices=['present', 'absent'], default='present', type='str'),
             location=dict(type='str'),
             short_hostname=dict(type='str'),
@@ -551,8 +605,15 @@ class AzureRMVirtualMachine(AzureRMModuleBase):
         self.restarted = None
         self.started = None
         self.stopped = None
+        self.vms = None
+        self.max_concurrent_vms = None
         self.differences = None
 
+        # Results of lookups shared by the virtual machines of a batch
+        self._lookups = dict()
+        self._lookup_lock = threading.Lock()
+        self._lookup_locks = dict()
+
         self.results = dict(
             changed=False,
             actions=[],
@@ -561,6 +622,8 @@ class AzureRMVirtualMachine(AzureRMModuleBase):
         )
 
         super(AzureRMVirtualMachine, self).__init__(derived_arg_spec=self.module_arg_spec,
+                                                    mutually_exclusive=[('name', 'vms')],
+                                                    required_one_of=[('name', 'vms')],
                                                     supports_check_mode=True)
 
     def exec_module(self, **kwargs):
@@ -568,6 +631,9 @@ class AzureRMVirtualMachine(AzureRMModuleBase):
         for key in self.module_arg_spec.keys() + ['tags']:
             setattr(self, key, kwargs[key])
 
+        if self.vms:
+            return self.exec_batch(**kwargs)
+
         changed = False
         powerstate_change = None
         results = dict()
@@ -577,7 +643,8 @@ class AzureRMVirtualMachine(AzureRMModuleBase):
         disable_ssh_password = None
         vm_dict = None
         
-        resource_group = self.get_resource_group(self.resource_group)
+        resource_group = self.lookup(('resource_group', self.resource_group),
+                                     lambda: self.get_resource_group(self.resource_group))
         if not self.location:
             # Set default location
             self.location = resource_group.location
@@ -724,15 +791,25 @@ class AzureRMVirtualMachine(AzureRMModuleBase):
                     if not self.image:
                         self.fail("Parameter error: an image is required when creating a virtual machine.")
 
-                    # Get defaults
-                    if not self.network_interface_names:
-                        default_nic = self.create_default_nic()
+                    # Get defaults. The network interface and storage account do not depend on each other, so
+                    # they are created concurrently. Create the clients before the workers need them.
+                    self.network_client
+                    self.storage_client
+                    created = run_parallel(lambda create: create() if create else None, [
+                        self.create_default_nic if not self.network_interface_names else None,
+                        self.create_default_storage_account if not self.storage_account_name else None
+                    ])
+                    for result, error in created:
+                        if error:
+                            self.fail(str(error))
+                    default_nic, storage_account = [result for result, error in created]
+
+                    if default_nic:
                         self.log("network interface:")
                         self.log(self.serialize_obj(default_nic, 'NetworkInterface'), pretty_print=True)
                         network_interfaces = [default_nic.id]
 
-                    if not self.storage_account_name:
-                        storage_account = self.create_default_storage_account()
+                    if storage_account:
                         self.log("storage account:")
                         self.log(self.serialize_obj(storage_account, 'StorageAccount'), pretty_print=True)
                         requested_vhd_uri = 'https://{0}.blob.core.windows.net/{1}/{2}'.format(
@@ -889,6 +966,150 @@ class AzureRMVirtualMachine(AzureRMModuleBase):
 
         return self.results
 
+    def exec_batch(self, **kwargs):
+        '''
+        Manage each virtual machine in self.vms, up to max_concurrent_vms at a time. Each virtual machine is
+        managed by a copy of the module, with the task parameters overridden by the virtual machine's settings.
+        The settings are checked against the module's argument spec. The copies share lookups, so shared settings
+        are validated once.
+
+        :return: module results, with the result of each virtual machine in vms
+        '''
+        specs = []
+        names = set()
+        for spec in self.vms:
+            if not isinstance(spec, dict) or not spec.get('name'):
+                self.fail("Parameter error: expecting vms to be a list of type dict where each dict contains "
+                          "a name key.")
+            params = copy.deepcopy(kwargs)
+            params.update(self.check_vm_spec(spec))
+            params['vms'] = None
+            # two workers managing the same VM, NIC and public IP would race
+            vm_key = (params['resource_group'].lower(), params['name'].lower())
+            if vm_key in names:
+                self.fail("Parameter error: virtual machine {0} appears more than once in vms".format(
+                    params['name']))
+            names.add(vm_key)
+            if params.get('admin_password'):
+                # hide passwords in the results, as no_log hides module parameters
+                self.module.no_log_values.add(params['admin_password'])
+            specs.append(params)
+
+        # create the clients before the workers need them
+        self.compute_client
+        self.network_client
+        self.storage_client
+
+        def manage_vm(params):
+            vm = copy.copy(self)
+            vm.differences = None
+            vm.results = dict(
+                changed=False,
+                actions=[],
+                powerstate_change=None,
+                state=dict()
+            )
+            return vm.exec_module(**params)
+
+        self.results['vms'] = []
+        errors = []
+        for params, (result, error) in zip(specs, run_parallel(manage_vm, specs, self.max_concurrent_vms)):
+            if error:
+                errors.append("{0} - {1}".format(params['name'], str(error)))
+                self.results['vms'].append(dict(name=params['name'], failed=True, msg=str(error)))
+                continue
+            result['name'] = params['name']
+            self.results['vms'].append(result)
+            self.results['actions'] += result['actions']
+            if result['changed']:
+                self.results['changed'] = True
+
+        if errors:
+            self.fail("Error managing virtual machines: {0}".format('; '.join(errors)), **self.results)
+        return self.results
+
+    def check_vm_spec(self, spec):
+        '''
+        Check the settings of a virtual machine in vms against the module's argument spec, resolving aliases,
+        converting values to the option's type and checking choices.
+
+        :param spec: dict of virtual machine settings
+        :return: dict of option name: value
+        '''
+        options = dict()
+        for option, option_spec in self.module_arg_spec.items():
+            if option not in ('vms', 'max_concurrent_vms'):
+                for key in [option] + option_spec.get('aliases', []):
+                    options[key] = option
+        unknown = [key for key in spec if key not in options]
+        if unknown:
+            self.fail("Parameter error: unsupported keys {0} for virtual machine {1}".format(
+                ', '.join(sorted(unknown)), spec['name']))
+
+        result = dict()
+        for key, value in spec.items():
+            option = options[key]
+            option_spec = self.module_arg_spec[option]
+            if value is not None:
+                try:
+                    value = self.convert_vm_spec_value(value, option_spec.get('type', 'str'))
+                except (TypeError, ValueError):
+                    self.fail("Parameter error: {0} of virtual machine {1} must be of type {2}".format(
+                        key, spec['name'], option_spec.get('type', 'str')))
+                if option_spec.get('choices') and value not in option_spec['choices']:
+                    self.fail("Parameter error: {0} of virtual machine {1} must be one of: {2}".format(
+                        key, spec['name'], ', '.join(option_spec['choices'])))
+            result[option] = copy.deepcopy(value)
+        return result
+
+    def convert_vm_spec_value(self, value, value_type):
+        if value_type == 'bool':
+            if isinstance(value, bool):
+                return value
+            if isinstance(value, basestring) or isinstance(value, int):
+                if str(value).lower() in BOOLEANS_TRUE:
+                    return True
+                if str(value).lower() in BOOLEANS_FALSE:
+                    return False
+            raise ValueError(value)
+        if value_type == 'int':
+            if isinstance(value, bool):
+                raise TypeError(value)
+            return int(value)
+        if value_type == 'list':
+            if isinstance(value, basestring):
+                return value.split(',')
+            if isinstance(value, list):
+                return value
+            if isinstance(value, (int, float)):
+                return [str(value)]
+            raise TypeError(value)
+        if value_type == 'dict':
+            if isinstance(value, dict):
+                return value
+            raise TypeError(value)
+        if isinstance(value, basestring):
+            return value
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        raise TypeError(value)
+
+    def lookup(self, key, func):
+        '''
+        Return the result of func, calling it only the first time key is looked up. Each key has its own lock, so
+        workers only wait for lookups of the same key.
+
+        :param key: tuple identifying the lookup
+        :param func: function returning the result
+        :return: result of func
+        '''
+        with self._lookup_lock:
+            key_lock = self._lookup_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self._lookups:
+                self._lookups[key] = func()
+            return self._lookups[key]
+
     def get_vm(self):
         '''
         Get the VM with expanded instanceView
@@ -986,6 +1207,7 @@ class AzureRMVirtualMachine(AzureRMModuleBase):
         vhd_uris = []
         nic_names = []
         pip_names = []
+        nic_pip_names = dict()
 
         if self.delete_virtual_storage:
             # store the attached vhd info so we can nuke it after the VM is gone
@@ -1006,10 +1228,12 @@ class AzureRMVirtualMachine(AzureRMModuleBase):
                 # also store each nic's attached public IPs and delete after the NIC is gone
                 for name in nic_names:
                     nic = self.get_network_interface(name)
+                    nic_pip_names[name] = []
                     for ipc in nic.ip_configurations:
                         if ipc.public_ip_address:
                             pip_dict = azure_id_to_dict(ipc.public_ip_address.id)
                             pip_names.append(pip_dict['publicIPAddresses'])
+                            nic_pip_names[name].append(pip_dict['publicIPAddresses'])
                 self.log('Public IPs to  delete are {0}'.format(', '.join(pip_names)))
                 self.results['deleted_public_ips'] = pip_names
 
@@ -1022,21 +1246,36 @@ class AzureRMVirtualMachine(AzureRMModuleBase):
         except Exception as exc:
             self.fail("Error deleting virtual machine {0} - {1}".format(self.name, str(exc)))
 
-        # TODO: parallelize nic, vhd, and public ip deletions with begin_deleting
-        # TODO: best-effort to keep deleting other linked resources if we encounter an error
+        # Delete VHDs and network interfaces concurrently. The public IPs of a network interface are deleted as
+        # soon as it is gone. Errors are collected, so one failure does not leave the other resources behind.
+        deletions = []
         if self.delete_virtual_storage:
             self.log('Deleting virtual storage')
-            self.delete_vm_storage(vhd_uris)
+            # create the client before the workers need it
+            self.storage_client
+            for uri in vhd_uris:
+                try:
+                    blob_parts = extract_names_from_blob_uri(uri)
+                except Exception as exc:
+                    self.fail("Error parsing blob URI {0}".format(str(exc)))
+                self.results['actions'].append("Deleted blob {0}:{1}".format(blob_parts['containername'],
+                                                                             blob_parts['blobname']))
+                deletions.append(partial(self.delete_vm_storage, [uri]))
 
         if self.delete_network_interfaces:
             self.log('Deleting network interfaces')
             for name in nic_names:
-                self.delete_nic(name)
+                self.results['actions'].append("Deleted network interface {0}".format(name))
+                deletions.append(partial(self.delete_nic_and_pips, name, nic_pip_names.get(name, [])))
 
         if self.delete_public_ips:
             self.log('Deleting public IPs')
             for name in pip_names:
-                self.delete_pip(name)
+                self.results['actions'].append("Deleted public IP {0}".format(name))
+
+        errors = [str(error) for result, error in run_parallel(lambda deletion: deletion(), deletions) if error]
+        if errors:
+            self.fail("Error deleting resources of virtual machine {0} - {1}".format(self.name, '; '.join(errors)))
         return True
 
     def get_network_interface(self, name):
@@ -1046,9 +1285,14 @@ class AzureRMVirtualMachine(AzureRMModuleBase):
         except Exception as exc:
             self.fail("Error fetching network interface {0} - {1}".format(name, str(exc)))
 
+    def delete_nic_and_pips(self, name, pip_names):
+        self.delete_nic(name)
+        for pip_name in pip_names:
+            self.delete_pip(pip_name)
+        return True
+
     def delete_nic(self, name):
         self.log("Deleting network interface {0}".format(name))
-        self.results['actions'].append("Deleted network interface {0}".format(name))
         try:
             poller = self.network_client.network_interfaces.delete(self.resource_group, name)
         except Exception as exc:
@@ -1058,7 +1302,7 @@ class AzureRMVirtualMachine(AzureRMModuleBase):
         return True
 
     def delete_pip(self, name):
-        self.results['actions'].append("Deleted public IP {0}".format(name))
+        self.log("Deleting public IP {0}".format(name))
         try:
             poller = self.network_client.public_ip_addresses.delete(self.resource_group, name)
             self.get_poller_result(poller)
@@ -1081,7 +1325,6 @@ class AzureRMVirtualMachine(AzureRMModuleBase):
             blob_client = self.get_blob_client(self.resource_group, storage_account_name)
 
             self.log("Delete blob {0}:{1}".format(container_name, blob_name))
-            self.results['actions'].append("Deleted blob {0}:{1}".format(container_name, blob_name))
             try:
                 blob_client.delete_blob(container_name, blob_name)
             except Exception as exc:
@@ -1089,10 +1332,12 @@ class AzureRMVirtualMachine(AzureRMModuleBase):
 
     def get_image_version(self):
         try:
-            versions = self.compute_client.virtual_machine_images.list(self.location,
-                                                                       self.image['publisher'],
-                                                                       self.image['offer'],
-                                                                       self.image['sku'])
+            versions = self.lookup(('image_versions', self.location, self.image['publisher'], self.image['offer'],
+                                    self.image['sku']),
+                                   lambda: self.compute_client.virtual_machine_images.list(self.location,
+                                                                                          self.image['publisher'],
+                                                                                          self.image['offer'],
+                                                                                          self.image['sku']))
         except Exception as exc:
             self.fail("Error fetching image {0} {1} {2} - {4}".format(self.image['publisher'],
                                                                       self.image['offer'],
@@ -1133,13 +1378,12 @@ class AzureRMVirtualMachine(AzureRMModuleBase):
         :return: boolean
         '''
         try:
-            sizes = self.compute_client.virtual_machine_sizes.list(self.location)
+            sizes = self.lookup(('vm_sizes', self.location),
+                                lambda: [size.name for size in self.compute_client.virtual_machine_sizes.list(
+                                    self.location)])
         except Exception as exc:
             self.fail("Error retrieving available machine sizes - {0}".format(str(exc)))
-        for size in sizes:
-            if size.name == self.vm_size:
-                return True
-        return False
+        return self.vm_size in sizes
 
     def create_default_storage_account(self):
         '''
@@ -1268,12 +1512,19 @@ class AzureRMVirtualMachine(AzureRMModuleBase):
             if not subnet_id:
                 self.fail(no_subnets_msg)
 
+        # The public IP and security group are created concurrently, and the NIC as soon as both are ready
         self.results['actions'].append('Created default public IP {0}'.format(self.name + '01'))
-        pip = self.create_default_pip(self.resource_group, self.location, self.name, self.public_ip_allocation_method)
-
         self.results['actions'].append('Created default security group {0}'.format(self.name + '01'))
-        group = self.create_default_securitygroup(self.resource_group, self.location, self.name, self.os_type,
-                                                  self.open_ports)
+        created = run_parallel(lambda create: create(), [
+            partial(self.create_default_pip, self.resource_group, self.location, self.name,
+                    self.public_ip_allocation_method),
+            partial(self.create_default_securitygroup, self.resource_group, self.location, self.name, self.os_type,
+                    self.open_ports)
+        ])
+        for result, error in created:
+            if error:
+                self.fail(str(error))
+        pip, group = [result for result, error in created]
 
         parameters = NetworkInterface(
             location=self.location,
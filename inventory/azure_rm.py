@@ -134,9 +134,25 @@ Or, select hosts for specific tag key:value pairs by assigning a comma separated
 
 AZURE_TAGS=key1:value1,key2:value2
 
-If you don't need the powerstate, you can improve performance by turning off powerstate fetching:
+Cache inventory results on disk by setting a maximum cache age in seconds. A separate cache file is kept for each
+subscription and combination of the settings above. Use --refresh-cache to ignore the cache and query Azure.
+
+AZURE_CACHE_PATH=~/.ansible/tmp
+AZURE_CACHE_MAX_AGE=300
+
+Powerstate is read from instance views listed for the whole subscription in one paged call, when the installed
+Azure SDK supports listing instance views (the status_only argument of virtual_machines.list_all, added after
+azure-mgmt-compute 0.30, which uses API version 2016-03-30). Otherwise, and when resource_groups is set, since
+instance views cannot be listed per resource group and listing the whole subscription to read a few groups can
+cost more, the instance view of each host is fetched with at least AZURE_POWERSTATE_WORKERS (10) concurrent
+requests, or the number of workers if higher. If you don't need the powerstate, you can improve performance by
+turning off powerstate fetching:
 AZURE_INCLUDE_POWERSTATE=no
 
+Host variables that require a request per host, such as powerstate, can be looked up concurrently. Set the
+number of worker threads with --workers or:
+AZURE_INVENTORY_WORKERS=10
+
 azure_rm.ini
 ------------
 As mentioned above you can control execution using environment variables or an .ini file. A sample
@@ -180,10 +196,17 @@ Version: 1.0.0
 
 import argparse
 import ConfigParser
+import fcntl
+import hashlib
+import inspect
 import json 
 import os
+import Queue
 import re
 import sys
+import tempfile
+import threading
+import time
 
 from os.path import expanduser
 
@@ -220,11 +243,23 @@ AZURE_CONFIG_SETTINGS = dict(
     group_by_resource_group='AZURE_GROUP_BY_RESOURCE_GROUP',
     group_by_location='AZURE_GROUP_BY_LOCATION',
     group_by_security_group='AZURE_GROUP_BY_SECURITY_GROUP',
-    group_by_tag='AZURE_GROUP_BY_TAG'
+    group_by_tag='AZURE_GROUP_BY_TAG',
+    workers='AZURE_INVENTORY_WORKERS',
+    cache_path='AZURE_CACHE_PATH',
+    cache_max_age='AZURE_CACHE_MAX_AGE'
 )
 
 AZURE_MIN_VERSION = "2016-03-30"
 
+# Resource provider registrations are shared with the azure_rm modules through this directory
+AZURE_CACHE_DIR = os.environ.get('AZURE_CACHE_DIR', expanduser('~/.azure/ansible'))
+
+# Seconds to trust a cached 'Registered' state before asking Azure to register a resource provider again
+AZURE_PROVIDER_CACHE_TTL = 7 * 24 * 3600
+
+# Minimum number of threads fetching instance views when they cannot be listed
+AZURE_POWERSTATE_WORKERS = 10
+
 
 def azure_id_to_dict(id):
     pieces = re.sub(r'^\/', '', id).split('/')
@@ -243,6 +278,7 @@ class AzureRM(object):
         self._compute_client = None
         self._resource_client = None
         self._network_client = None
+        self._azure_credentials = None
 
         self.debug = False
         if args.debug:
@@ -258,18 +294,32 @@ class AzureRM(object):
         self.log("setting subscription_id")
         self.subscription_id = self.credentials['subscription_id']
 
-        if self.credentials.get('client_id') is not None and \
-           self.credentials.get('secret') is not None and \
-           self.credentials.get('tenant') is not None:
-            self.azure_credentials = ServicePrincipalCredentials(client_id=self.credentials['client_id'],
-                                                                 secret=self.credentials['secret'],
-                                                                 tenant=self.credentials['tenant'])
-        elif self.credentials.get('ad_user') is not None and self.credentials.get('password') is not None:
-            self.azure_credentials = UserPassCredentials(self.credentials['ad_user'], self.credentials['password'])
-        else:
+        if not self._has_service_principal() and not self._has_ad_user():
             self.fail("Failed to authenticate with provided credentials. Some attributes were missing. "
                       "Credentials must include client_id, secret and tenant or ad_user and password.")
 
+    def _has_service_principal(self):
+        return self.credentials.get('client_id') is not None and \
+            self.credentials.get('secret') is not None and \
+            self.credentials.get('tenant') is not None
+
+    def _has_ad_user(self):
+        return self.credentials.get('ad_user') is not None and self.credentials.get('password') is not None
+
+    @property
+    def azure_credentials(self):
+        # Authenticating requests a token, so it is put off until a client is needed. Inventory served from
+        # the cache never authenticates.
+        if not self._azure_credentials:
+            if self._has_service_principal():
+                self._azure_credentials = ServicePrincipalCredentials(client_id=self.credentials['client_id'],
+                                                                      secret=self.credentials['secret'],
+                                                                      tenant=self.credentials['tenant'])
+            else:
+                self._azure_credentials = UserPassCredentials(self.credentials['ad_user'],
+                                                              self.credentials['password'])
+        return self._azure_credentials
+
     def log(self, msg):
         if self.debug:
             print (msg + u'\n')
@@ -347,14 +397,54 @@ class AzureRM(object):
         return None
 
     def _register(self, key):
+        if self._provider_is_registered(key):
+            self.log("Provider {0} is registered".format(key))
+            return
+
         try:
             # We have to perform the one-time registration here. Otherwise, we receive an error the first
             # time we attempt to use the requested client.
             resource_client = self.rm_client
-            resource_client.providers.register(key)
+            provider = resource_client.providers.register(key)
         except Exception as exc:
             self.fail("One-time registration of {0} failed - {1}".format(key, str(exc)))
 
+        if provider and provider.registration_state == 'Registered':
+            self._cache_provider_registration(key)
+
+    def _read_provider_cache(self):
+        try:
+            with open(os.path.join(AZURE_CACHE_DIR, 'providers.json'), 'r') as cache:
+                return json.load(cache)
+        except (IOError, OSError, ValueError):
+            return dict()
+
+    def _provider_is_registered(self, key):
+        registered_at = self._read_provider_cache().get(self.subscription_id, dict()).get(key)
+        return registered_at is not None and registered_at + AZURE_PROVIDER_CACHE_TTL > time.time()
+
+    def _cache_provider_registration(self, key):
+        lock_file = None
+        try:
+            if not os.path.isdir(AZURE_CACHE_DIR):
+                os.makedirs(AZURE_CACHE_DIR, 0o700)
+            # the same lock file as the azure_rm modules, so concurrent runs do not lose each other's entries
+            lock_file = os.fdopen(os.open(os.path.join(AZURE_CACHE_DIR, 'providers.json.lock'),
+                                          os.O_CREAT | os.O_RDWR, 0o600))
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            providers = self._read_provider_cache()
+            providers.setdefault(self.subscription_id, dict())[key] = time.time()
+            fd, temp_path = tempfile.mkstemp(dir=AZURE_CACHE_DIR, prefix='.providers.json')
+            with os.fdopen(fd, 'w') as cache:
+                json.dump(providers, cache)
+            os.rename(temp_path, os.path.join(AZURE_CACHE_DIR, 'providers.json'))
+        except (IOError, OSError):
+            # the cache is an optimization, so failing to write it is not an error
+            pass
+        finally:
+            if lock_file:
+                lock_file.close()
+
     @property
     def network_client(self):
         self.log('Getting network client')
@@ -393,10 +483,14 @@ class AzureInventory(object):
         except Exception as e:
             sys.exit("{0}".format(str(e)))
 
-        self._compute_client = rm.compute_client
-        self._network_client = rm.network_client
-        self._resource_client = rm.rm_client
+        self._subscription_id = rm.subscription_id
+        self._compute_client = None
+        self._network_client = None
+        self._resource_client = None
         self._security_groups = None
+        self._network_interfaces = None
+        self._public_ip_addresses = None
+        self._powerstates = None
 
         self.resource_groups = []
         self.tags = None
@@ -406,6 +500,9 @@ class AzureInventory(object):
         self.group_by_security_group = True
         self.group_by_tag = True
         self.include_powerstate = True
+        self.workers = 1
+        self.cache_path = os.path.expanduser('~/.ansible/tmp')
+        self.cache_max_age = 0
 
         self._inventory = dict(
             _meta=dict(
@@ -425,7 +522,17 @@ class AzureInventory(object):
         if self._args.no_powerstate:
             self.include_powerstate = False
 
-        self.get_inventory()
+        if self._args.workers:
+            self.workers = self._args.workers
+
+        if self._args.refresh_cache or not self._load_inventory_from_cache():
+            self._compute_client = rm.compute_client
+            self._network_client = rm.network_client
+            self._resource_client = rm.rm_client
+            self.get_inventory()
+            if not self._args.host:
+                self._write_inventory_to_cache()
+
         print (self._json_format_dict(pretty=self._args.pretty))
         sys.exit(0)
 
@@ -461,9 +568,20 @@ class AzureInventory(object):
                             help='Return inventory for comma separated list of tag key:value pairs')
         parser.add_argument('--no-powerstate', action='store_true', default=False,
                             help='Do not include the power state of each virtual host')
+        parser.add_argument('--workers', action='store', type=int,
+                            help='Number of threads used to look up host variables (default: 1)')
+        parser.add_argument('--refresh-cache', action='store_true', default=False,
+                            help='Force refresh of the cache by making API requests to Azure '
+                                 '(default: False - use cache files)')
         return parser.parse_args()
 
     def get_inventory(self):
+        if not self._args.host:
+            # Resolve network interfaces and public IPs from memory rather than with a GET per host
+            self._get_network_index()
+            if self.include_powerstate:
+                self._get_powerstates()
+
         if len(self.resource_groups) > 0:
             # get VMs for requested resource groups
             for resource_group in self.resource_groups:
@@ -491,103 +609,159 @@ class AzureInventory(object):
                 self._load_machines(virtual_machines)
 
     def _load_machines(self, machines):
-        for machine in machines:
-            id_dict = azure_id_to_dict(machine.id)
-
-            #TODO - The API is returning an ID value containing resource group name in ALL CAPS. If/when it gets
-            #       fixed, we should remove the .lower(). Opened Issue
-            #       #574: https://github.com/Azure/azure-sdk-for-python/issues/574
-            resource_group = id_dict['resourceGroups'].lower()
-
-            if self.group_by_security_group:
-                self._get_security_groups(resource_group)
-
-            host_vars = dict(
-                ansible_host=None,
-                private_ip=None,
-                private_ip_alloc_method=None,
-                public_ip=None,
-                public_ip_name=None,
-                public_ip_id=None,
-                public_ip_alloc_method=None,
-                fqdn=None,
-                location=machine.location,
-                name=machine.name,
-                type=machine.type,
-                id=machine.id,
-                tags=machine.tags,
-                network_interface_id=None,
-                network_interface=None,
-                resource_group=resource_group,
-                mac_address=None,
-                plan=(machine.plan.name if machine.plan else None),
-                virtual_machine_size=machine.hardware_profile.vm_size.value,
-                computer_name=machine.os_profile.computer_name,
-                provisioning_state=machine.provisioning_state,
-            )
+        machines = list(machines)
 
-            host_vars['os_disk'] = dict(
-                name=machine.storage_profile.os_disk.name,
-                operating_system_type=machine.storage_profile.os_disk.os_type.value
-            )
+        if self.include_powerstate:
+            self._get_missing_powerstates(machines)
 
-            if self.include_powerstate:
+        if self.group_by_security_group:
+            # Populate the security group mappings up front, so host lookups running in worker threads only read
+            # from them.
+            for machine in machines:
+                self._get_security_groups(self._get_resource_group_name(machine))
+
+        # Host vars are resolved concurrently, but hosts are added in the order the API returned them
+        for host_vars in self._map(self._get_host_vars, machines):
+            self._add_host(host_vars)
+
+    def _get_resource_group_name(self, machine):
+        id_dict = azure_id_to_dict(machine.id)
+
+        #TODO - The API is returning an ID value containing resource group name in ALL CAPS. If/when it gets
+        #       fixed, we should remove the .lower(). Opened Issue
+        #       #574: https://github.com/Azure/azure-sdk-for-python/issues/574
+        return id_dict['resourceGroups'].lower()
+
+    def _get_host_vars(self, machine):
+        resource_group = self._get_resource_group_name(machine)
+
+        host_vars = dict(
+            ansible_host=None,
+            private_ip=None,
+            private_ip_alloc_method=None,
+            public_ip=None,
+            public_ip_name=None,
+            public_ip_id=None,
+            public_ip_alloc_method=None,
+            fqdn=None,
+            location=machine.location,
+            name=machine.name,
+            type=machine.type,
+            id=machine.id,
+            tags=machine.tags,
+            network_interface_id=None,
+            network_interface=None,
+            resource_group=resource_group,
+            mac_address=None,
+            plan=(machine.plan.name if machine.plan else None),
+            virtual_machine_size=machine.hardware_profile.vm_size.value,
+            computer_name=machine.os_profile.computer_name,
+            provisioning_state=machine.provisioning_state,
+        )
+
+        host_vars['os_disk'] = dict(
+            name=machine.storage_profile.os_disk.name,
+            operating_system_type=machine.storage_profile.os_disk.os_type.value
+        )
+
+        if self.include_powerstate:
+            if self._powerstates and machine.id.lower() in self._powerstates:
+                host_vars['powerstate'] = self._powerstates[machine.id.lower()]
+            else:
                 host_vars['powerstate'] = self._get_powerstate(resource_group, machine.name)
 
-            if machine.storage_profile.image_reference:
-                host_vars['image'] = dict(
-                    offer=machine.storage_profile.image_reference.offer,
-                    publisher=machine.storage_profile.image_reference.publisher,
-                    sku=machine.storage_profile.image_reference.sku,
-                    version=machine.storage_profile.image_reference.version
-                )
-
-            # Add windows details
-            if machine.os_profile.windows_configuration is not None:
-                host_vars['windows_auto_updates_enabled'] = \
-                    machine.os_profile.windows_configuration.enable_automatic_updates
-                host_vars['windows_timezone'] = machine.os_profile.windows_configuration.time_zone
-                host_vars['windows_rm'] = None
-                if machine.os_profile.windows_configuration.win_rm is not None:
-                    host_vars['windows_rm'] = dict(listeners=None)
-                    if machine.os_profile.windows_configuration.win_rm.listeners is not None:
-                        host_vars['windows_rm']['listeners'] = []
-                        for listener in machine.os_profile.windows_configuration.win_rm.listeners:
-                            host_vars['windows_rm']['listeners'].append(dict(protocol=listener.protocol,
-                                                                             certificate_url=listener.certificate_url))
-
-            for interface in machine.network_profile.network_interfaces:
-                interface_reference = self._parse_ref_id(interface.id)
-                network_interface = self._network_client.network_interfaces.get(
-                    interface_reference['resourceGroups'],
-                    interface_reference['networkInterfaces'])
-                if network_interface.primary:
-                    if self.group_by_security_group and \
-                       self._security_groups[resource_group].get(network_interface.id, None):
-                        host_vars['security_group'] = \
-                            self._security_groups[resource_group][network_interface.id]['name']
-                        host_vars['security_group_id'] = \
-                            self._security_groups[resource_group][network_interface.id]['id']
-                    host_vars['network_interface'] = network_interface.name
-                    host_vars['network_interface_id'] = network_interface.id
-                    host_vars['mac_address'] = network_interface.mac_address
-                    for ip_config in network_interface.ip_configurations:
-                        host_vars['private_ip'] = ip_config.private_ip_address
-                        host_vars['private_ip_alloc_method'] = ip_config.private_ip_allocation_method.value
-                        if ip_config.public_ip_address:
-                            public_ip_reference = self._parse_ref_id(ip_config.public_ip_address.id)
-                            public_ip_address = self._network_client.public_ip_addresses.get(
-                                public_ip_reference['resourceGroups'],
-                                public_ip_reference['publicIPAddresses'])
-                            host_vars['ansible_host'] = public_ip_address.ip_address
-                            host_vars['public_ip'] = public_ip_address.ip_address
-                            host_vars['public_ip_name'] = public_ip_address.name
-                            host_vars['public_ip_alloc_method'] = public_ip_address.public_ip_allocation_method.value
-                            host_vars['public_ip_id'] = public_ip_address.id
-                            if public_ip_address.dns_settings:
-                                host_vars['fqdn'] = public_ip_address.dns_settings.fqdn
+        if machine.storage_profile.image_reference:
+            host_vars['image'] = dict(
+                offer=machine.storage_profile.image_reference.offer,
+                publisher=machine.storage_profile.image_reference.publisher,
+                sku=machine.storage_profile.image_reference.sku,
+                version=machine.storage_profile.image_reference.version
+            )
+
+        # Add windows details
+        if machine.os_profile.windows_configuration is not None:
+            host_vars['windows_auto_updates_enabled'] = \
+                machine.os_profile.windows_configuration.enable_automatic_updates
+            host_vars['windows_timezone'] = machine.os_profile.windows_configuration.time_zone
+            host_vars['windows_rm'] = None
+            if machine.os_profile.windows_configuration.win_rm is not None:
+                host_vars['windows_rm'] = dict(listeners=None)
+                if machine.os_profile.windows_configuration.win_rm.listeners is not None:
+                    host_vars['windows_rm']['listeners'] = []
+                    for listener in machine.os_profile.windows_configuration.win_rm.listeners:
+                        host_vars['windows_rm']['listeners'].append(dict(protocol=listener.protocol,
+                                                                         certificate_url=listener.certificate_url))
+
+        for interface in machine.network_profile.network_interfaces:
+            network_interface = self._get_network_interface(interface.id)
+            if network_interface.primary:
+                if self.group_by_security_group and \
+                   self._security_groups[resource_group].get(network_interface.id, None):
+                    host_vars['security_group'] = \
+                        self._security_groups[resource_group][network_interface.id]['name']
+                    host_vars['security_group_id'] = \
+                        self._security_groups[resource_group][network_interface.id]['id']
+                host_vars['network_interface'] = network_interface.name
+                host_vars['network_interface_id'] = network_interface.id
+                host_vars['mac_address'] = network_interface.mac_address
+                for ip_config in network_interface.ip_configurations:
+                    host_vars['private_ip'] = ip_config.private_ip_address
+                    host_vars['private_ip_alloc_method'] = ip_config.private_ip_allocation_method.value
+                    if ip_config.public_ip_address:
+                        public_ip_address = self._get_public_ip_address(ip_config.public_ip_address.id)
+                        host_vars['ansible_host'] = public_ip_address.ip_address
+                        host_vars['public_ip'] = public_ip_address.ip_address
+                        host_vars['public_ip_name'] = public_ip_address.name
+                        host_vars['public_ip_alloc_method'] = public_ip_address.public_ip_allocation_method.value
+                        host_vars['public_ip_id'] = public_ip_address.id
+                        if public_ip_address.dns_settings:
+                            host_vars['fqdn'] = public_ip_address.dns_settings.fqdn
+
+        return host_vars
+
+    def _map(self, func, items, workers=None):
+        '''
+        Call func for each item using a pool of up to self.workers threads. Results are returned in the order of
+        items, so the inventory does not depend on the order in which the lookups complete.
 
-            self._add_host(host_vars)
+        :param func: function taking a single item
+        :param items: list of items
+        :param workers: number of threads, instead of self.workers
+        :return: list of results
+        '''
+        workers = workers or self.workers
+        if workers <= 1 or len(items) <= 1:
+            return [func(item) for item in items]
+
+        results = [None] * len(items)
+        errors = []
+        work = Queue.Queue()
+        for index, item in enumerate(items):
+            work.put((index, item))
+
+        def worker():
+            while True:
+                try:
+                    index, item = work.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    results[index] = func(item)
+                except BaseException as exc:
+                    # includes the SystemExit raised by sys.exit() on a failed lookup
+                    errors.append((index, exc))
+
+        threads = [threading.Thread(target=worker) for i in range(min(workers, len(items)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            # re-raise in the main thread, reporting the error for the first host in order
+            raise min(errors)[1]
+        return results
 
     def _selected_machines(self, virtual_machines):
         selected_machines = []
@@ -602,7 +776,7 @@ class AzureInventory(object):
         ''' For a given resource_group build a mapping of network_interface.id to security_group name '''
         if not self._security_groups:
             self._security_groups = dict()
-        if not self._security_groups.get(resource_group):
+        if resource_group not in self._security_groups:
             self._security_groups[resource_group] = dict()
             for group in self._network_client.network_security_groups.list(resource_group):
                 if group.network_interfaces:
@@ -612,6 +786,87 @@ class AzureInventory(object):
                             id=group.id
                         )
 
+    def _get_network_index(self):
+        '''
+        Build mappings of network interface id and public IP address id to object. Makes one paged list call
+        for the subscription, or one per resource group when resource_groups is set, instead of one call per host.
+        '''
+        self._network_interfaces = dict()
+        self._public_ip_addresses = dict()
+        try:
+            if len(self.resource_groups) > 0:
+                for resource_group in self.resource_groups:
+                    for interface in self._network_client.network_interfaces.list(resource_group):
+                        self._network_interfaces[interface.id.lower()] = interface
+                    for public_ip in self._network_client.public_ip_addresses.list(resource_group):
+                        self._public_ip_addresses[public_ip.id.lower()] = public_ip
+            else:
+                for interface in self._network_client.network_interfaces.list_all():
+                    self._network_interfaces[interface.id.lower()] = interface
+                for public_ip in self._network_client.public_ip_addresses.list_all():
+                    self._public_ip_addresses[public_ip.id.lower()] = public_ip
+        except Exception as exc:
+            sys.exit("Error: fetching network interfaces and public IP addresses - {0}".format(str(exc)))
+
+    def _get_network_interface(self, id):
+        ''' Look up a network interface in the index, falling back to a GET for ids outside of the index '''
+        # Resource group names are not consistently cased in ids, so the index is keyed on the lowercase id
+        if self._network_interfaces and self._network_interfaces.get(id.lower()):
+            return self._network_interfaces[id.lower()]
+        reference = self._parse_ref_id(id)
+        return self._network_client.network_interfaces.get(reference['resourceGroups'],
+                                                           reference['networkInterfaces'])
+
+    def _get_public_ip_address(self, id):
+        ''' Look up a public IP address in the index, falling back to a GET for ids outside of the index '''
+        if self._public_ip_addresses and self._public_ip_addresses.get(id.lower()):
+            return self._public_ip_addresses[id.lower()]
+        reference = self._parse_ref_id(id)
+        return self._network_client.public_ip_addresses.get(reference['resourceGroups'],
+                                                            reference['publicIPAddresses'])
+
+    def _get_powerstates(self):
+        '''
+        Build a mapping of virtual machine id to powerstate by listing instance views of the subscription with
+        statusOnly, in one paged call. Instance views cannot be listed per resource group, and listing the whole
+        subscription to read a few groups can cost more than fetching the instance views of their hosts, so the
+        mapping is left empty when resource_groups is set, or when the installed SDK does not support statusOnly.
+        The hosts are then filled in by _get_missing_powerstates.
+        '''
+        if len(self.resource_groups) > 0 or not self._can_list_instance_views():
+            return
+
+        try:
+            machines = self._compute_client.virtual_machines.list_all(status_only='true')
+            self._powerstates = dict((machine.id.lower(),
+                                      self._get_powerstate_from_instance_view(machine.instance_view))
+                                     for machine in machines if machine.instance_view)
+        except Exception as exc:
+            sys.exit("Error: fetching virtual machine instance views - {0}".format(str(exc)))
+
+    def _get_missing_powerstates(self, machines):
+        '''
+        Fetch the instance views of machines missing from the powerstate mapping concurrently, with at least
+        AZURE_POWERSTATE_WORKERS threads, so host vars do not wait on a GET per host.
+
+        :param machines: list of virtual machines
+        '''
+        missing = [machine for machine in machines if machine.id.lower() not in (self._powerstates or dict())]
+        powerstates = self._map(lambda machine: self._get_powerstate(self._get_resource_group_name(machine),
+                                                                     machine.name),
+                                missing, max(self.workers, AZURE_POWERSTATE_WORKERS))
+        if self._powerstates is None:
+            self._powerstates = dict()
+        for machine, powerstate in zip(missing, powerstates):
+            self._powerstates[machine.id.lower()] = powerstate
+
+    def _can_list_instance_views(self):
+        # Older SDKs accept unknown arguments in **operation_config and silently drop status_only
+        try:
+            return 'status_only' in inspect.getargspec(self._compute_client.virtual_machines.list_all).args
+        except TypeError:
+            return False
+
     def _get_powerstate(self, resource_group, name):
         try:
             vm = self._compute_client.virtual_machines.get(resource_group,
@@ -620,8 +875,11 @@ class AzureInventory(object):
         except Exception as exc:
             sys.exit("Error: fetching instanceview for host {0} - {1}".format(name, str(exc)))
 
+        return self._get_powerstate_from_instance_view(vm.instance_view)
+
+    def _get_powerstate_from_instance_view(self, instance_view):
         return next((s.code.replace('PowerState/', '')
-                    for s in vm.instance_view.statuses if s.code.startswith('PowerState')), None)
+                    for s in instance_view.statuses if s.code.startswith('PowerState')), None)
 
     def _add_host(self, vars):
 
@@ -660,6 +918,77 @@ class AzureInventory(object):
                 self._inventory[safe_key].append(host_name)
                 self._inventory[safe_value].append(host_name)
 
+    def _get_cache_file(self):
+        '''
+        Return the path of the cache file for the current subscription and settings. Any setting that changes
+        which hosts are selected or how they are grouped produces a different file.
+        '''
+        settings = dict(
+            subscription_id=self._subscription_id,
+            resource_groups=sorted(self.resource_groups),
+            tags=sorted(self.tags) if self.tags else None,
+            include_powerstate=self.include_powerstate,
+            replace_dash_in_groups=self.replace_dash_in_groups,
+            group_by_resource_group=self.group_by_resource_group,
+            group_by_location=self.group_by_location,
+            group_by_security_group=self.group_by_security_group,
+            group_by_tag=self.group_by_tag,
+        )
+        key = hashlib.sha1(json.dumps(settings, sort_keys=True)).hexdigest()
+        return os.path.join(self.cache_path, 'ansible-azure-rm-{0}.cache'.format(key))
+
+    def _load_inventory_from_cache(self):
+        '''
+        Load the inventory from the cache file, if one exists and is younger than cache_max_age. When run for a
+        specific host, the host is selected from the cached inventory.
+
+        :return: True if the inventory was loaded from the cache
+        '''
+        if self.cache_max_age <= 0:
+            return False
+
+        cache_file = self._get_cache_file()
+        try:
+            if os.path.getmtime(cache_file) + self.cache_max_age < time.time():
+                return False
+            with open(cache_file, 'r') as cache:
+                inventory = json.load(cache)
+        except (IOError, OSError, ValueError):
+            # missing or unreadable cache file
+            return False
+
+        if not self._args.host:
+            self._inventory = inventory
+            return True
+
+        hosts = [inventory['_meta']['hostvars'][host_name] for host_name in inventory['azure']]
+        if not any(host_vars['name'] == self._args.host for host_vars in hosts):
+            return False
+        for host_vars in hosts:
+            if host_vars['name'] == self._args.host or (self.tags and self._tags_match(host_vars['tags'],
+                                                                                        self.tags)):
+                self._add_host(host_vars)
+        return True
+
+    def _write_inventory_to_cache(self):
+        '''
+        Write the inventory to the cache file. The file is written to a temporary file and then renamed, so
+        concurrent runs never read a partial cache.
+        '''
+        if self.cache_max_age <= 0:
+            return
+
+        cache_file = self._get_cache_file()
+        try:
+            if not os.path.isdir(self.cache_path):
+                os.makedirs(self.cache_path)
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_path, prefix='.ansible-azure-rm-')
+            with os.fdopen(fd, 'w') as cache:
+                cache.write(self._json_format_dict())
+            os.rename(temp_path, cache_file)
+        except (IOError, OSError) as exc:
+            sys.exit("Error: writing cache file {0} - {1}".format(cache_file, str(exc)))
+
     def _json_format_dict(self, pretty=False):
         # convert inventory to json
         if pretty:
@@ -677,6 +1006,10 @@ class AzureInventory(object):
                     values = file_settings.get(key).split(',')
                     if len(values) > 0:
                         setattr(self, key, values)
+                elif key in ('workers', 'cache_max_age') and file_settings.get(key, None) is not None:
+                    setattr(self, key, self._to_int(file_settings[key]))
+                elif key == 'cache_path' and file_settings.get(key, None) is not None:
+                    setattr(self, key, os.path.expandvars(os.path.expanduser(file_settings[key])))
                 elif file_settings.get(key, None) is not None:
                     val = self._to_boolean(file_settings[key])
                     setattr(self, key, val)
@@ -687,6 +1020,10 @@ class AzureInventory(object):
                     values = env_settings.get(key).split(',')
                     if len(values) > 0:
                         setattr(self, key, values)
+                elif key in ('workers', 'cache_max_age') and env_settings.get(key, None) is not None:
+                    setattr(self, key, self._to_int(env_settings[key]))
+                elif key == 'cache_path' and env_settings.get(key, None) is not None:
+                    setattr(self, key, os.path.expandvars(os.path.expanduser(env_settings[key])))
                 elif env_settings.get(key, None) is not None:
                     val = self._to_boolean(env_settings[key])
                     setattr(self, key, val)
@@ -708,6 +1045,12 @@ class AzureInventory(object):
             result = True
         return result
 
+    def _to_int(self, value):
+        try:
+            return int(value)
+        except ValueError:
+            sys.exit("Error: expecting an integer value. Found {0}".format(value))
+
     def _get_env_settings(self):
         env_settings = dict()
         for attribute, env_variable in AZURE_CONFIG_SETTINGS.iteritems():